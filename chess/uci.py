@@ -26,7 +26,11 @@ import subprocess
 import logging
 import threading
 import collections 
+import os
+import re
+import selectors
 import sys
+import time
 
 try:
     import queue
@@ -45,6 +49,17 @@ LOGGER = logging.getLogger(__name__)
 POLL_TIMEOUT = 5
 STOP_TIMEOUT = 2
 
+MOVE_PATTERNS = {
+    "chess": re.compile(r"^(?:[a-h][1-8][a-h][1-8][qrbn]?|0000)$"),
+    "xiangqi": re.compile(r"^[a-i][0-9][a-i][0-9]$"),
+    "jieqi": re.compile(r"^[a-i][0-9][a-i][0-9][a-zA-Z]{0,2}$"),
+}
+
+# Options some engines handle by reallocating or reloading, see
+# Engine.option_change_handlers.
+EXPENSIVE_OPTIONS = ("Hash", "EvalFile", "Threads")
+EXPENSIVE_OPTIONS_LOWER = frozenset(name.lower() for name in EXPENSIVE_OPTIONS)
+
 
 class Option(collections.namedtuple("Option", ["name", "type", "default", "min", "max", "var"])):
     """Information about an available option for an UCI engine."""
@@ -278,6 +293,7 @@ class Command(object):
         self._result = None
         self._done = False
         self._done_callbacks = []
+        self.timestamps = {"enqueue": time.perf_counter_ns()}
 
     def _invoke_callbacks(self):
         for callback in self._done_callbacks:
@@ -336,6 +352,7 @@ class Command(object):
                 raise TimeoutError()
 
     def set_result(self, result):
+        self.timestamps.setdefault("result", time.perf_counter_ns())
         with self._condition:
             self._result = result
             self._done = True
@@ -351,7 +368,7 @@ class UciCommand(Command):
     def execute(self, engine):
         engine.uciok.clear()
         engine.send_line("uci")
-        engine.uciok.wait()
+        engine._wait(engine.uciok)
         self.set_result(None)
 
 
@@ -375,7 +392,7 @@ class IsReadyCommand(Command):
     def execute(self, engine):
         engine.readyok.clear()
         engine.send_line("isready")
-        engine.readyok.wait()
+        engine._wait(engine.readyok)
         self.set_result(None)
 
 
@@ -390,26 +407,43 @@ class SetOptionCommand(IsReadyCommand):
             builder.append("setoption name ")
             builder.append(name)
             builder.append(" value ")
-            if value is True:
-                builder.append("true")
-            elif value is False:
-                builder.append("false")
-            elif value is None:
-                builder.append("none")
-            else:
-                builder.append(str(value))
+            builder.append(option_value(value))
 
             self.option_lines.append("".join(builder))
 
     def execute(self, engine):
+        if not self.option_lines:
+            return self.set_result(None)
+
+        if engine.pipelined:
+            for option_line in self.option_lines:
+                engine._defer_line(option_line)
+            return self.set_result(None)
+
         for option_line in self.option_lines:
             engine.send_line(option_line)
 
         super(SetOptionCommand, self).execute(engine)
 
 
+def option_value(value):
+    """Format an option value the way it is sent with *setoption*."""
+    if value is True:
+        return "true"
+    elif value is False:
+        return "false"
+    elif value is None:
+        return "none"
+    else:
+        return str(value)
+
+
 class UciNewGameCommand(IsReadyCommand):
     def execute(self, engine):
+        if engine.pipelined:
+            engine._defer_line("ucinewgame")
+            return self.set_result(None)
+
         engine.send_line("ucinewgame")
         super(UciNewGameCommand, self).execute(engine)
 
@@ -418,6 +452,10 @@ class PositionCommand(IsReadyCommand):
     def __init__(self, board):
         super(PositionCommand, self).__init__()
 
+        if isinstance(board, PositionBuilder):
+            self.buf = board.buf
+            return
+
         builder = []
         builder.append("position")
 
@@ -443,10 +481,42 @@ class PositionCommand(IsReadyCommand):
         self.buf = " ".join(builder)
 
     def execute(self, engine):
+        if engine.pipelined:
+            engine._defer_line(self.buf)
+            return self.set_result(None)
+
         engine.send_line(self.buf)
         super(PositionCommand, self).execute(engine)
 
 
+class PositionBuilder(object):
+    """
+    Builds the *position* command of a game move by move.
+
+    Only the moves added since the last update are appended, instead of
+    joining the whole move list again every ply.
+
+    >>> builder = PositionBuilder("fen " + fen)
+    >>> engine.position(builder.update(moves))
+    """
+    def __init__(self, position="startpos"):
+        self.head = "position " + position + " moves"
+        self.buf = self.head
+        self.count = 0
+
+    def update(self, moves):
+        if len(moves) < self.count:
+            # Moves were taken back, start over.
+            self.buf = self.head
+            self.count = 0
+
+        if len(moves) > self.count:
+            self.buf += " " + " ".join(moves[self.count:])
+            self.count = len(moves)
+
+        return self
+
+
 class GoCommand(Command):
     def __init__(self, searchmoves=None, ponder=False, wtime=None, btime=None, winc=None, binc=None, movestogo=None, depth=None, nodes=None, mate=None, movetime=None, infinite=False):
         super(GoCommand, self).__init__()
@@ -512,11 +582,12 @@ class GoCommand(Command):
         engine.bestmove = None
         engine.ponder = None
         engine.bestmove_received.clear()
+        engine._pending_info.clear()
         engine.send_line(self.buf)
         if self.infinite or self.ponder:
             self.set_result(None)
         else:
-            engine.bestmove_received.wait()
+            engine._wait(engine.bestmove_received)
             self.set_result(BestMove(engine.bestmove, engine.ponder))
 
 
@@ -531,9 +602,9 @@ class StopCommand(Command):
             engine.send_line("stop")
 
         engine.send_line("isready")
-        engine.readyok.wait()
+        engine._wait(engine.readyok)
 
-        engine.bestmove_received.wait(STOP_TIMEOUT)
+        engine._wait(engine.bestmove_received, STOP_TIMEOUT)
         self.set_result(BestMove(engine.bestmove, engine.ponder))
 
 
@@ -544,14 +615,14 @@ class PonderhitCommand(Command):
         engine.bestmove_received.clear()
         engine.send_line("ponderhit")
 
-        engine.bestmove_received.wait()
+        engine._wait(engine.bestmove_received)
         self.set_result(BestMove(engine.bestmove, engine.ponder))
 
 
 class QuitCommand(Command):
     def execute(self, engine):
         engine.send_line("quit")
-        engine.terminated.wait()
+        engine._wait(engine.terminated)
         self.set_result(engine.process.wait_for_return_code())
 
 
@@ -627,29 +698,35 @@ class MockProcess(object):
 
 
 class PopenProcess(object):
-    def __init__(self, command):
+    def __init__(self, command, encoding="gb2312"):
         self.command = command
+        self.encoding = encoding
         self.dead = False
         self._receiving_thread = threading.Thread(target=self._receiving_thread_target)
         self._receiving_thread.daemon = True
 
     def spawn(self, engine):
         self.engine = engine
-        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stdin=subprocess.PIPE, bufsize=1, universal_newlines=True, encoding="gb2312")
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stdin=subprocess.PIPE)
         self._receiving_thread.start()
 
     def _receiving_thread_target(self):
-        while self.is_alive():
+        # Reading until EOF instead of polling the process, so that a closing
+        # engine can not make this loop spin.
+        while True:
             try:
                 line = self.process.stdout.readline()
-                if not line:
-                    continue
+            except (OSError, ValueError):
+                break
+            if not line:
+                break
 
-                self.engine.on_line_received(line.rstrip())
+            try:
+                self.engine.on_bytes_received(line.rstrip())
             except Exception as e:
                 print(repr(e))
-                self.dead = True
 
+        self.dead = True
         self.engine.on_terminated()
 
     def is_alive(self):
@@ -666,9 +743,11 @@ class PopenProcess(object):
         self.process.stdin.close()
 
     def send_line(self, string):
-        string = string.replace("\ufeff", "")
-        self.process.stdin.write(string)
-        self.process.stdin.write("\n")
+        self.send_lines([string])
+
+    def send_lines(self, lines):
+        data = "".join(line.replace("\ufeff", "") + "\n" for line in lines)
+        self.process.stdin.write(data.encode(self.encoding, errors="replace"))
         self.process.stdin.flush()
 
     def wait_for_return_code(self):
@@ -747,6 +826,154 @@ class SpurProcess(object):
         return "<SpurProcess at {0} (pid={1})>".format(hex(id(self)), self.pid())
 
 
+class Reactor(object):
+    """
+    A single thread that owns the stdout pipes of many engine processes.
+
+    Readiness is multiplexed with :mod:`selectors` (epoll on Linux). Output is
+    read without blocking, split into lines and dispatched to the engines, so
+    engines driven by a reactor need no threads of their own.
+    """
+    def __init__(self):
+        self.selector = selectors.DefaultSelector()
+        self._pending = []
+        self._lock = threading.Lock()
+        self._wakeup_r, self._wakeup_w = os.pipe()
+        os.set_blocking(self._wakeup_r, False)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, None)
+        self._thread = threading.Thread(target=self._thread_target)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def register(self, process):
+        with self._lock:
+            self._pending.append(process)
+        os.write(self._wakeup_w, b"\0")
+
+    def _thread_target(self):
+        while True:
+            for key, _ in self.selector.select():
+                if key.data is None:
+                    self._register_pending()
+                else:
+                    self._read(key.data)
+
+    def _register_pending(self):
+        try:
+            while os.read(self._wakeup_r, 4096):
+                pass
+        except BlockingIOError:
+            pass
+
+        with self._lock:
+            pending, self._pending = self._pending, []
+
+        for process in pending:
+            self.selector.register(process.stdout_fd, selectors.EVENT_READ, process)
+
+    def _read(self, process):
+        try:
+            data = os.read(process.stdout_fd, 65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if data:
+            try:
+                process.on_data(data)
+            except Exception:
+                LOGGER.exception("exception processing output of %r", process)
+        else:
+            self.selector.unregister(process.stdout_fd)
+            process.on_eof()
+
+
+_reactor = None
+_reactor_lock = threading.Lock()
+
+
+def get_reactor():
+    """Returns the reactor shared by all engines of this process."""
+    global _reactor
+    with _reactor_lock:
+        if _reactor is None:
+            _reactor = Reactor()
+        return _reactor
+
+
+class ReactorProcess(object):
+    def __init__(self, command, reactor=None, encoding="gb2312"):
+        self.command = command
+        self.reactor = reactor or get_reactor()
+        self.encoding = encoding
+        self.dead = False
+        self._buffer = b""
+        self._write_lock = threading.Lock()
+
+    def spawn(self, engine):
+        self.engine = engine
+        self.process = subprocess.Popen(self.command, stdout=subprocess.PIPE, stdin=subprocess.PIPE, bufsize=0)
+        self.stdout_fd = self.process.stdout.fileno()
+        os.set_blocking(self.stdout_fd, False)
+        self.reactor.register(self)
+
+    def on_data(self, data):
+        # Called by the reactor thread.
+        lines = (self._buffer + data).split(b"\n")
+        self._buffer = lines.pop()
+        for line in lines:
+            self.engine.on_bytes_received(line.rstrip())
+
+    def on_eof(self):
+        # Called by the reactor thread. A closed stdout means the engine is
+        # gone, even if the process has not exited yet.
+        self.dead = True
+        self.process.stdout.close()
+        if self.process.poll() is None:
+            self.process.kill()
+        self.engine.on_terminated()
+
+    def is_alive(self):
+        return not self.dead and self.process.poll() is None
+
+    def terminate(self):
+        self.process.terminate()
+
+    def kill(self):
+        self.process.kill()
+
+    def close_std_streams(self):
+        # stdout belongs to the reactor and is closed once it reaches EOF.
+        with self._write_lock:
+            self.process.stdin.close()
+
+    def send_line(self, string):
+        self.send_lines([string])
+
+    def send_lines(self, lines):
+        data = "".join(line.replace("\ufeff", "") + "\n" for line in lines)
+        data = data.encode(self.encoding, errors="replace")
+        with self._write_lock:
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[self.process.stdin.write(view):]
+            except (OSError, ValueError):
+                # The engine is gone. Termination is reported by the reactor.
+                pass
+
+    def wait_for_return_code(self):
+        self.process.wait()
+        return self.process.returncode
+
+    def pid(self):
+        return self.process.pid
+
+    def __repr__(self):
+        return "<ReactorProcess at {0} (pid={1})>".format(hex(id(self)), self.pid())
+
+
 class Engine(object):
     def __init__(self, process, chess_db=False):
         self.process = process
@@ -763,10 +990,39 @@ class Engine(object):
         self.bestmove_received = threading.Event()
         self.chess_db = chess_db
         self.chess_db_pos = ""
+        self.position_builder = None
+
+        # In lazy info mode only the latest info lines are kept as raw text
+        # and parsed once the bestmove arrives.
+        self.encoding = getattr(process, "encoding", "utf-8")
+        self.lazy_info = False
+        self._pending_info = {}
+        self._pending_info_count = 0
+
+        # Moves in info lines are chess.Move objects unless string moves are
+        # enabled, see use_string_moves().
+        self.string_moves = False
+        self.move_pattern = None
+
+        # In pipelined mode ucinewgame, setoption and position do not wait
+        # for readyok. Their lines are held back and written together with
+        # the next command, usually go.
+        self.pipelined = False
+        self._pending_lines = []
+
+        # The last value sent per option. Unchanged options are not sent
+        # again. Handlers are called with (name, old_value, new_value) when an
+        # option in EXPENSIVE_OPTIONS actually changes.
+        self.sent_options = OptionMap()
+        self.option_change_handlers = []
+
+        # Records the timestamps of each finished command when set by the
+        # caller, e.g. to a util.latency.LatencyStats.
+        self.latency = None
+        self._current_command = None
 
         self.queue = queue.Queue()
-        self.stdin_thread = threading.Thread(target=self._stdin_thread_target)
-        self.stdin_thread.daemon = True
+        self.stdin_thread = None
 
         self.return_code = None
         self.terminated = threading.Event()
@@ -774,12 +1030,71 @@ class Engine(object):
         self.info_handlers = []
 
         self.process.spawn(self)
+        self._start_command_processing()
+
+    def _start_command_processing(self):
+        self.stdin_thread = threading.Thread(target=self._stdin_thread_target)
+        self.stdin_thread.daemon = True
         self.stdin_thread.start()
 
+    def _wait(self, event, timeout=None):
+        return event.wait(timeout)
+
     def send_line(self, line):
+        if self._pending_lines:
+            lines, self._pending_lines = self._pending_lines, []
+            lines.append(line)
+            return self.send_lines(lines)
+
         LOGGER.debug("%s << %s", self.process, line)
+        self._mark("write")
         return self.process.send_line(line)
 
+    def send_lines(self, lines):
+        for line in lines:
+            LOGGER.debug("%s << %s", self.process, line)
+        self._mark("write")
+
+        send_lines = getattr(self.process, "send_lines", None)
+        if send_lines is None:
+            for line in lines:
+                self.process.send_line(line)
+        else:
+            send_lines(lines)
+
+    def _defer_line(self, line):
+        self._pending_lines.append(line)
+
+    def _mark(self, stage):
+        command = self._current_command
+        if command is not None and stage not in command.timestamps:
+            command.timestamps[stage] = time.perf_counter_ns()
+
+    def _run_command(self, command):
+        self._current_command = command
+        try:
+            command.execute(self)
+        finally:
+            self._current_command = None
+            if self.latency is not None:
+                name = type(command).__name__
+                self.latency.record(name[:-7].lower() if name.endswith("Command") else name, command.timestamps)
+
+    def on_bytes_received(self, buf):
+        command = self._current_command
+        if command is not None and "first_output" not in command.timestamps and "write" in command.timestamps:
+            command.timestamps["first_output"] = time.perf_counter_ns()
+
+        # Info lines are by far the most frequent output. In lazy info mode
+        # they are kept undecoded until the bestmove arrives.
+        if self.lazy_info and buf.startswith(b"info ") and not buf.startswith(b"info string"):
+            LOGGER.debug("%s >> %r", self.process, buf)
+            if self.info_handlers:
+                self._defer_info(buf[5:].lstrip())
+            return
+
+        self.on_line_received(buf.decode(self.encoding, errors="replace"))
+
     def on_line_received(self, buf):
         LOGGER.debug("%s >> %s", self.process, buf)
 
@@ -817,7 +1132,7 @@ class Engine(object):
             if not self.is_alive():
                 break
 
-            command.execute(self)
+            self._run_command(command)
             self.queue.task_done()
 
         self.on_terminated()
@@ -850,6 +1165,10 @@ class Engine(object):
         self.readyok.set()
 
     def _bestmove(self, arg):
+        self._mark("bestmove")
+        if self._pending_info:
+            self._flush_info()
+
         tokens = arg.split(None, 2)
         self.bestmove = tokens[0]
         if len(tokens) >= 3 and tokens[1] == "ponder" and tokens[2] != "(none)":
@@ -873,6 +1192,65 @@ class Engine(object):
         if not self.info_handlers:
             return
 
+        if self.lazy_info and not arg.startswith("string"):
+            self._defer_info(arg.encode(self.encoding, errors="replace"))
+        else:
+            self._parse_info(arg)
+
+    def _defer_info(self, arg):
+        # Keep the raw latest line per multipv and the latest line with a
+        # score per multipv. Everything else is superseded.
+        entry = (self._pending_info_count, arg)
+        self._pending_info_count += 1
+
+        multipv = 1
+        index = arg.find(b"multipv ")
+        if index != -1:
+            try:
+                multipv = int(arg[index + 8:].split(b" ", 1)[0])
+            except ValueError:
+                pass
+        if b" score " in arg or arg.startswith(b"score "):
+            self._pending_info[("score", multipv)] = entry
+        self._pending_info[multipv] = entry
+
+    def _flush_info(self):
+        # Decode and parse the kept lines in the order they were received.
+        lines = sorted(set(self._pending_info.values()))
+        self._pending_info.clear()
+        for _, arg in lines:
+            self._parse_info(arg.decode(self.encoding, errors="replace"))
+
+    def use_string_moves(self, variant=None):
+        """
+        Report moves in info lines (pv, currmove, refutation, currline) as
+        plain strings instead of *chess.Move* objects.
+
+        If *variant* is one of *MOVE_PATTERNS* tokens are validated against
+        its move syntax, so that for example xiangqi moves like ``a0i9`` are
+        kept. Otherwise every token is accepted.
+        """
+        self.string_moves = True
+        self.move_pattern = MOVE_PATTERNS.get(variant)
+
+    def _move_parser(self):
+        if not self.string_moves:
+            return chess.Move.from_uci
+
+        pattern = self.move_pattern
+        if pattern is None:
+            return str
+
+        def parse_move(token):
+            if pattern.match(token) is None:
+                raise ValueError("invalid move token: {0}".format(token))
+            return token
+
+        return parse_move
+
+    def _parse_info(self, arg):
+        parse_move = self._move_parser()
+
         # Notify info handlers of start.
         for info_handler in self.info_handlers:
             info_handler.pre_info(arg)
@@ -925,7 +1303,7 @@ class Engine(object):
 
         def handle_move_token(token, fn):
             try:
-                move = chess.Move.from_uci(token)
+                move = parse_move(token)
             except ValueError:
                 return
 
@@ -976,7 +1354,7 @@ class Engine(object):
                 handle_integer_token(token, lambda handler, val: handler.nodes(val))
             elif current_parameter == "pv":
                 try:
-                    pv.append(chess.Move.from_uci(token))
+                    pv.append(parse_move(token))
                 except ValueError:
                     pass
             elif current_parameter == "multipv":
@@ -1014,9 +1392,9 @@ class Engine(object):
             elif current_parameter == "refutation":
                 try:
                     if refutation_move is None:
-                        refutation_move = chess.Move.from_uci(token)
+                        refutation_move = parse_move(token)
                     else:
-                        refuted_by.append(chess.Move.from_uci(token))
+                        refuted_by.append(parse_move(token))
                 except ValueError:
                     pass
             elif current_parameter == "currline":
@@ -1024,7 +1402,7 @@ class Engine(object):
                     if currline_cpunr is None:
                         currline_cpunr = int(token)
                     else:
-                        currline_moves.append(chess.Move.from_uci(token))
+                        currline_moves.append(parse_move(token))
                 except ValueError:
                     pass
 
@@ -1164,11 +1542,38 @@ class Engine(object):
         """
         Set a values for the engines available options.
 
+        Options are only sent if their value differs from the one sent last.
+        Buttons are always sent.
+
         :param options: A dictionary with option names as keys.
 
         :return: Nothing
         """
-        return self._queue_command(SetOptionCommand(options), async_callback)
+        return self._queue_command(SetOptionCommand(self._changed_options(options)), async_callback)
+
+    def _changed_options(self, options):
+        changed = {}
+        for name, value in options.items():
+            option = self.options.get(name)
+            if value is None or (option is not None and option.type == "button"):
+                changed[name] = value
+                continue
+
+            new = option_value(value)
+            old = self.sent_options.get(name)
+            if old == new:
+                continue
+
+            changed[name] = value
+            self.sent_options[name] = new
+
+            if old is None and option is not None and option.default is not None:
+                old = option_value(option.default)
+            if old != new and name.lower() in EXPENSIVE_OPTIONS_LOWER:
+                for handler in self.option_change_handlers:
+                    handler(name, old, new)
+
+        return changed
 
     # TODO: Implement register command
 
@@ -1195,7 +1600,7 @@ class Engine(object):
         If the position is from a new game it is recommended to use the
         *ucinewgame* command before the *position* command.
 
-        :param board: A *chess.Board*.
+        :param board: A *chess.Board* or a :class:`PositionBuilder`.
 
         :return: Nothing
         """
@@ -1276,8 +1681,9 @@ class Engine(object):
 
         :return: The return code of the engine process.
         """
-        self.process.close_std_streams()
+        # Signal first, closing stdout would block on a pending read.
         self.process.terminate()
+        self.process.close_std_streams()
 
         promise = TerminationPromise(self)
         if _async:
@@ -1293,8 +1699,9 @@ class Engine(object):
 
         :return: The return code of the engine process.
         """
-        self.process.close_std_streams()
+        # Signal first, closing stdout would block on a pending read.
         self.process.kill()
+        self.process.close_std_streams()
 
         promise = TerminationPromise(self)
         if _async:
@@ -1307,6 +1714,76 @@ class Engine(object):
         return self.process.is_alive()
 
 
+class ReactorEngine(Engine):
+    """
+    An engine whose output is handled by a :class:`Reactor` and whose commands
+    are executed directly in the calling thread, so no threads are created
+    per engine.
+
+    Blocking calls with a float *async_callback* are bounded by that timeout
+    and raise *TimeoutError* like with :class:`Engine`. Other asynchronous
+    calls are run on a small shared thread pool.
+    """
+    def _start_command_processing(self):
+        self._command_lock = threading.Lock()
+        self._deadline = None
+
+    def _wait(self, event, timeout=None):
+        if self._deadline is None:
+            return event.wait(timeout)
+
+        remaining = self._deadline - time.monotonic()
+        if timeout is None or timeout > remaining:
+            if not event.wait(max(remaining, 0)):
+                raise TimeoutError()
+            return True
+        return event.wait(timeout)
+
+    def on_terminated(self):
+        super(ReactorEngine, self).on_terminated()
+        # Release commands waiting for an answer that will never come.
+        self.uciok.set()
+        self.readyok.set()
+
+    def _execute(self, command, timeout=None):
+        if timeout is None:
+            self._command_lock.acquire()
+        elif not self._command_lock.acquire(timeout=timeout):
+            raise TimeoutError()
+
+        try:
+            self._deadline = None if timeout is None else time.monotonic() + timeout
+            self._run_command(command)
+        finally:
+            self._deadline = None
+            self._command_lock.release()
+
+    def _queue_command(self, command, async_callback=None):
+        if self.terminated.is_set():
+            raise RuntimeError('can not queue command for terminated uci engine')
+
+        if async_callback is True or (async_callback and not isinstance(async_callback, float)):
+            if async_callback is not True:
+                command.add_done_callback(async_callback)
+            _get_executor().submit(self._execute, command)
+            return command
+
+        self._execute(command, async_callback or None)
+        return command.result(timeout=0)
+
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    with _reactor_lock:
+        if _executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=4)
+        return _executor
+
+
 def popen_engine(command, engine_cls=Engine):
     """
     Opens a local chess engine process.
@@ -1341,3 +1818,20 @@ def spur_spawn_engine(shell, command, engine_cls=Engine):
     """
     process = SpurProcess(shell, command)
     return engine_cls(process)
+
+
+def reactor_spawn_engine(command, reactor=None, engine_cls=ReactorEngine):
+    """
+    Opens a local engine process whose output is handled by a shared
+    :class:`Reactor` instead of per engine threads.
+
+    >>> engine = chess.uci.reactor_spawn_engine("/usr/games/stockfish")
+    >>> engine.uci()
+
+    Falls back to :func:`popen_engine` on Windows, where pipes can not be
+    multiplexed with :mod:`selectors`.
+    """
+    if os.name == 'nt':
+        return popen_engine(command)
+    process = ReactorProcess(command, reactor)
+    return engine_cls(process)
@@ -9,6 +9,8 @@ import argparse
 
 import fishtest
 import util.client_helper as client_helper
+import util.artifact as artifact
+import util.binary_prep as binary_prep
 import multiprocessing as mp
 from fishtest import Tester
 from subprocess import Popen, PIPE
@@ -29,11 +31,15 @@ tester: Tester = Tester()
 running = True
 NO_OUTPUT = True
 CPU_THREADS = mp.cpu_count()
+LONG_POLL_MAX_FAILURES = 5  # consecutive failed polls before falling back to get_tasks polling
+HEARTBEAT_INTERVAL = 30  # seconds between heartbeats, also between the polls while the queue is full
 FILE_PATH = "./files/"
 gendata_process: Popen = None
 data_generator = "./colab"
 download_failed_count = 0
 spsa_record = {}
+pending_uploads = {}  # task_id -> results not uploaded yet, retried until the server took them
+long_poll = True
 
 
 def print(*args, **kwargs):
@@ -88,6 +94,10 @@ def scan_existing_files():
         if file.startswith("engine") or file.endswith(".nnue"):
             if os.path.getsize(FILE_PATH + file) > 1024 * 100 and file not in downloaded_file_list:
                 downloaded_file_list.append(file)
+        if file.endswith(".nnue" + artifact.COMPRESSED_EXT):
+            name = file[:-len(artifact.COMPRESSED_EXT)]
+            if name not in downloaded_file_list:
+                downloaded_file_list.append(name)
         if file.startswith("weight_"):
             os.rename(FILE_PATH + file, FILE_PATH + f"xiangqi-{file[7:]}.nnue")
             new_name = f"xiangqi-{file[7:]}.nnue"
@@ -111,11 +121,8 @@ def download_needed_file(task_id, task, webdrives):
                 return False
             if engine not in downloaded_file_list:
                 downloaded_file_list.append(engine)
-        if not os.path.exists(FILE_PATH + engine + "_upx") and os.path.exists(FILE_PATH + engine) and os.name != 'nt':
-            print(f"UPX 压缩: {FILE_PATH + engine}")
-            os.system("chmod +x ./upx")
-            os.system(f"chmod +x {FILE_PATH + engine}")
-            os.system(f"./upx -{random.choice([str(i) for i in range(1, 10)])} -o {FILE_PATH + engine + '_upx'} {FILE_PATH + engine}")
+        if os.path.exists(FILE_PATH + engine):
+            binary_prep.prepare(FILE_PATH + engine, log=print)
 
     if task['weight_url']:
         file_id = task['weight_url'].split("/")[-1].split(".")[0].split("_")[-1].strip("_")
@@ -130,6 +137,7 @@ def download_needed_file(task_id, task, webdrives):
                 print("权重文件错误")
                 print("可能是网盘超限，等待")
                 return False
+            artifact.compress(FILE_PATH + weight)
             if weight not in downloaded_file_list:
                 downloaded_file_list.append(weight)
 
@@ -148,12 +156,8 @@ def download_needed_file(task_id, task, webdrives):
                 return False
             if baseline_engine not in downloaded_file_list:
                 downloaded_file_list.append(baseline_engine)
-            if not os.path.exists(FILE_PATH + baseline_engine + "_upx") and os.path.exists(FILE_PATH + baseline_engine) and os.name != 'nt':
-                print(f"UPX 压缩: {FILE_PATH + baseline_engine}")
-                os.system("chmod +x ./upx")
-                os.system(f"chmod +x {FILE_PATH + baseline_engine}")
-                os.system(
-                    f"./upx -{random.choice([str(i) for i in range(1, 10)])} -o {FILE_PATH + baseline_engine + '_upx'} {FILE_PATH + baseline_engine}")
+        if os.path.exists(FILE_PATH + baseline_engine):
+            binary_prep.prepare(FILE_PATH + baseline_engine, log=print)
 
     if task['baseline_weight_url']:
         file_id = task['baseline_weight_url'].split("/")[-1].split(".")[0].split("_")[-1].strip("_")
@@ -168,15 +172,28 @@ def download_needed_file(task_id, task, webdrives):
                 print("基准权重文件错误")
                 print("可能是网盘超限，等待")
                 return False
+            artifact.compress(FILE_PATH + baseline_weight)
             if baseline_weight not in downloaded_file_list:
                 downloaded_file_list.append(baseline_weight)
     return True
 
 
-def heartbeat_loop():
+def handle_server_notices(data):
     global running
-    initial_sleep_time = 30
-    sleep_time = 30
+    if "program_version" in data and data["program_version"] != program_version:
+        print("版本不一致，请更新版本")
+        running = False
+        exit(0)
+    if "invalid_task_ids" in data:
+        try:
+            tester.remove_tasks(data["invalid_task_ids"])
+        except Exception as e:
+            print(repr(e))
+
+
+def heartbeat_loop():
+    initial_sleep_time = HEARTBEAT_INTERVAL
+    sleep_time = HEARTBEAT_INTERVAL
     while running:
         time.sleep(sleep_time)
         sleep_time = initial_sleep_time
@@ -184,15 +201,13 @@ def heartbeat_loop():
         if data is None:
             sleep_time = 5
             continue
-        if "program_version" in data and data["program_version"] != program_version:
-            print("版本不一致，请更新版本")
-            running = False
-            exit(0)
-        if "invalid_task_ids" in data:
-            try:
-                tester.remove_tasks(data["invalid_task_ids"])
-            except Exception as e:
-                print(repr(e))
+        handle_server_notices(data)
+
+
+def start_heartbeat():
+    thread_heartbeat = threading.Thread(target=heartbeat_loop)
+    thread_heartbeat.daemon = True
+    thread_heartbeat.start()
 
 
 def get_name(url):
@@ -277,15 +292,86 @@ def add_to_task(task_id, task):
                     draw_move_limit=task['draw_move_limit'], draw_score_limit=task['draw_score_limit'],
                     win_move_limit=task['win_move_limit'], win_score_limit=task['win_score_limit'],
                     draw_as_black_win=task['draw_as_black_win'], mate1_judge=task['mate1_judge'],
+                    joint_adjudication=task.get('joint_adjudication'),
                     book=task['book'],
                     variant=task['variant'])
     print(f"添加 来自 {task_id} 的 {num_games} 个 {task['type']} 测试局面到队列成功")
 
 
+def queue_is_short():
+    return len(tester.task_queue) < min(CPU_THREADS, 32)
+
+
+def accept_task(data):
+    global download_failed_count
+    task_data = select_task(data["tasks"])
+    if task_data is None:
+        return False
+    stop_gendata_process()
+    task_id = task_data["task_id"]
+    task = task_data["task"]
+    task_type = task_data["type"]
+    webdrives = data["webdrives"]
+    if task_type == "spsa":
+        spsa_record[task_id] = task_data
+    result = download_needed_file(task_id, task, webdrives)
+    if result:
+        download_failed_count = 0
+        add_to_task(task_id, task)
+    else:
+        print(f"下载失败，等待 {download_failed_count * 30}s")
+        download_failed_count += 1
+        time.sleep(download_failed_count * 30)
+    return True
+
+
+def long_poll_loop():
+    """
+    Hold one poll request open at a time while tasks are wanted; returns when
+    the server does not support long polling or it failed
+    LONG_POLL_MAX_FAILURES times in a row. The polls are the heartbeats: while
+    the queue is full or a task is being accepted, the server is only polled
+    every HEARTBEAT_INTERVAL seconds without being held, and the queue is
+    checked every 0.2 s like the polling loop.
+    """
+    failures = 0
+    last_poll_time = 0
+    accept_thread = None
+    while running:
+        want_tasks = queue_is_short() and (accept_thread is None or not accept_thread.is_alive())
+        if not want_tasks and time.time() - last_poll_time < HEARTBEAT_INTERVAL:
+            time.sleep(0.2)
+            continue
+        last_poll_time = time.time()
+        data = client_helper.poll_events(client_id, tester.get_task_ids_in_queue(), want_tasks,
+                                         wait=client_helper.LONG_POLL_WAIT if want_tasks else 0)
+        if data == client_helper.LONG_POLL_UNSUPPORTED:
+            print("服务器不支持长轮询，改用轮询")
+            return
+        if data is None:
+            failures += 1
+            if failures >= LONG_POLL_MAX_FAILURES:
+                print(f"长轮询连续失败 {failures} 次，改用轮询")
+                return
+            time.sleep(5)
+            continue
+        failures = 0
+        handle_server_notices(data)
+        if want_tasks and data.get("tasks") and queue_is_short():
+            # downloads may take a while, keep polling as heartbeat meanwhile
+            accept_thread = threading.Thread(target=accept_task, args=(data,))
+            accept_thread.daemon = True
+            accept_thread.start()
+
+
 def task_manage_loop():
-    global running, tester, download_failed_count
+    if long_poll:
+        long_poll_loop()
+        if not running:
+            return
+    start_heartbeat()
     while running:
-        if len(tester.task_queue) >= min(CPU_THREADS, 32):
+        if not queue_is_short():
             time.sleep(0.2)
             continue
         print("队列中任务不足，开始获取任务")
@@ -294,31 +380,11 @@ def task_manage_loop():
             print("获取任务失败")
             time.sleep(10)
             continue
-        if "program_version" in data and data["program_version"] != program_version:
-            print("版本不一致，请更新版本")
-            running = False
-            exit(0)
-        task_data = select_task(data["tasks"])
-        if task_data is None:
+        handle_server_notices(data)
+        if not accept_task(data):
             print("没有可用任务")
             start_gendata_process()
             time.sleep(20)
-            continue
-        stop_gendata_process()
-        task_id = task_data["task_id"]
-        task = task_data["task"]
-        task_type = task_data["type"]
-        webdrives = data["webdrives"]
-        if task_type == "spsa":
-            spsa_record[task_id] = task_data
-        result = download_needed_file(task_id, task, webdrives)
-        if result:
-            download_failed_count = 0
-            add_to_task(task_id, task)
-        else:
-            print(f"下载失败，等待 {download_failed_count * 30}s")
-            download_failed_count += 1
-            time.sleep(download_failed_count * 30)
 
 
 def check_is_all_done(results):
@@ -334,8 +400,9 @@ def result_waiting_loop():
     global running
     while running:
         try:
-            result_list = {}
-            
+            # results of failed uploads are sent again together with the new ones
+            result_list = pending_uploads
+
             with tester.lock:
                 if len(tester.abandon_list) > 0:
                     for item in tester.abandon_list.copy():
@@ -422,7 +489,6 @@ def result_waiting_loop():
                     if task_id in spsa_record:
                         task_type = "spsa"
                         info = spsa_record[task_id]
-                        del spsa_record[task_id]
                         current_iter = info["iter"]
                         vars1 = info["task"]["uci_options"]
                         vars2 = info["task"]["baseline_uci_options"]
@@ -431,6 +497,11 @@ def result_waiting_loop():
                                                          result["wdl"], result["fwdl"],
                                                          result["ptnml"], result["game_records"], task_type=task_type,
                                                          current_iter=current_iter, vars1=vars1, vars2=vars2)
+                    if result is None:
+                        print(f"上传 {task_id} 结果失败，稍后重试")
+                        continue
+                    del result_list[task_id]
+                    spsa_record.pop(task_id, None)
                     if result == "ver":
                         print(f"版本不一致，请更新版本")
                         running = False
@@ -447,13 +518,24 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--user", type=str, default="VinXiangQi")
     parser.add_argument("--output", action="store_true", default=False)
+    parser.add_argument("--no-long-poll", action="store_true", default=False)
+    parser.add_argument("--server", type=str, default="")
+    parser.add_argument("--tb-path", type=str, default=None, help="syzygy tables to adjudicate chess games")
+    parser.add_argument("--async-match", action="store_true", default=False,
+                        help="play xiangqi and chess games on asyncio engine transports")
     args = parser.parse_args()
     user = args.user
+    long_poll = not args.no_long_poll
+    if args.server:
+        client_helper.magic = args.server.rstrip("/")
     NO_OUTPUT = not args.output
     fishtest.NO_OUTPUT = NO_OUTPUT
+    fishtest.TB_PATH = args.tb_path
+    fishtest.ASYNC_MATCH = args.async_match
     client_id = user + "/" + client_id
 
     os.makedirs(FILE_PATH, exist_ok=True)
+    artifact.clean_cache()
 
     scan_existing_files()
     start_time = time.time()
@@ -463,9 +545,6 @@ if __name__ == "__main__":
     thread_result_waiting = threading.Thread(target=result_waiting_loop)
     thread_result_waiting.daemon = True
     thread_result_waiting.start()
-    thread_heartbeat = threading.Thread(target=heartbeat_loop)
-    thread_heartbeat.daemon = True
-    thread_heartbeat.start()
     try:
         task_manage_loop()
     except KeyboardInterrupt as e:
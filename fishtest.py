@@ -8,8 +8,15 @@ import random
 import traceback
 import shutil
 
+import util.artifact as artifact
+import util.binary_prep as binary_prep
+from match.adjudicator import JointAdjudication
+
 NO_OUTPUT = False
 VERBOSITY = 0
+TB_PATH = None  # syzygy tables used to adjudicate chess games
+ASYNC_MATCH = False  # play the ASYNC_VARIANTS on the asyncio runner instead of engine threads
+ASYNC_VARIANTS = ("xiangqi", "chess")
 
 DEFAULT_BOOK = {
     "xiangqi": "3mvs_140-200_150560",
@@ -104,6 +111,7 @@ class Tester:
                  win_score_limit=-1,
                  draw_as_black_win=False,
                  mate1_judge=False,
+                 joint_adjudication=None,
                  count=6,
                  book=None,
                  variant="xiangqi"):
@@ -151,6 +159,7 @@ class Tester:
                         "win_score_limit": win_score_limit,
                         "draw_as_black_win": draw_as_black_win,
                         "mate1_judge": mate1_judge,
+                        "joint_adjudication": joint_adjudication,
                     },
                     "error_count": 0
                 })
@@ -191,6 +200,7 @@ class Tester:
         baseline_options = ops["baseline_uci_ops"] or {}
         draw_as_black_win = ops["draw_as_black_win"]
         mate1_judge = ops["mate1_judge"]
+        joint_adjudication = JointAdjudication.from_options(ops.get("joint_adjudication"))
         nodestime = ops["nodestime"]
         thread_count = 1
 
@@ -220,7 +230,8 @@ class Tester:
                                        win_score_limit=win_score_limit,
                                        draw_as_black_win=draw_as_black_win,
                                        mate1_judge=mate1_judge,
-                                       verbosity=VERBOSITY)
+                                       verbosity=VERBOSITY,
+                                       joint_adjudication=joint_adjudication)
         elif variant == "jieqi":
             from match.jieqi_match import JieQiEngineMatch
             uci_options = {"Hash": hash, "Threads": thread_count,
@@ -243,7 +254,8 @@ class Tester:
                                      draw_score_limit=draw_score_limit,
                                      win_move_limit=win_move_limit,
                                      win_score_limit=win_score_limit,
-                                     verbosity=VERBOSITY)
+                                     verbosity=VERBOSITY,
+                                     joint_adjudication=joint_adjudication)
         elif variant == "chess":
             from match.chess_match import ChessEngineMatch
             uci_options = {"Hash": hash, "Threads": thread_count,
@@ -276,7 +288,9 @@ class Tester:
                                      win_score_limit=win_score_limit,
                                      draw_as_black_win=draw_as_black_win,
                                      mate1_judge=mate1_judge,
-                                     verbosity=VERBOSITY)
+                                     tb_path=TB_PATH,
+                                     verbosity=VERBOSITY,
+                                     joint_adjudication=joint_adjudication)
         elif variant.startswith("gomoku"):
             from match.gomoku_match import GomokuEngineMatch
             postfix = variant.split("_")[1]
@@ -287,12 +301,13 @@ class Tester:
                 dir = os.path.splitext(weight)[0] + '-' + os.path.splitext(engine_name)[0]
                 engine_path = os.path.join(dir, engine_name)
                 ready_path = os.path.join(dir, "ready")
+                # weight is considered as a zipped file of multiple weights and config,
+                # extracted once and shared by every engine using it
+                weight_dir = artifact.extract_zip(weight)
                 if not os.path.isdir(dir) or not os.path.isfile(ready_path):
                     try:
                         os.makedirs(dir, exist_ok=False)
-                        # weight is considered as a zipped file of multiple weights and config
-                        with zipfile.ZipFile(weight, "r") as f:
-                            f.extractall(dir)
+                        artifact.link_tree(weight_dir, dir)
                         shutil.copyfile(engine, engine_path)
                         open(ready_path, 'a').close()  # mark this dir as ready to use
                     except FileExistsError:
@@ -325,10 +340,15 @@ class Tester:
                                       win_move_limit=win_move_limit,
                                       win_score_limit=win_score_limit,
                                       draw_after=int(board_size * board_size * 0.85),
-                                      verbosity=VERBOSITY)
+                                      verbosity=VERBOSITY,
+                                      joint_adjudication=joint_adjudication)
         else:
             assert 0, f"unknown variant {variant}"
 
+        if ASYNC_MATCH and variant in ASYNC_VARIANTS:
+            from match.async_match import AsyncMatchRunner
+            return AsyncMatchRunner(match).run_game(order, 1 - order, fen)
+
         match.init_engines()
         time.sleep(0.2)
         if not match.check_engines_ok():
@@ -365,13 +385,10 @@ class Tester:
                 raise Exception("Engine File Not Exist")
             if not os.path.isfile(baseline_engine):
                 raise Exception("Baseline Engine File Not Exist")
-            if os.path.exists(engine + "_upx"):
-                engine += "_upx"
-            if os.path.exists(baseline_engine + "_upx"):
-                baseline_engine += "_upx"
-            if os.name != 'nt':
-                os.system(f"chmod +x {engine}")
-                os.system(f"chmod +x {baseline_engine}")
+            weight = artifact.materialize(weight)
+            baseline_weight = artifact.materialize(baseline_weight)
+            engine = binary_prep.select(engine, log=print)
+            baseline_engine = binary_prep.select(baseline_engine, log=print)
 
             start_time = time.time()
             res, game_record = self.process_match(variant, order, fen, engine, baseline_engine,
@@ -0,0 +1,156 @@
+import re
+
+# piskvork rule numbers, see GomokuEngineMatch
+FREESTYLE = 0
+STANDARD = 1
+RENJU = 4
+
+EMPTY, FIRST, SECOND = range(3)
+DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+# how deep the forbidden test of renju follows the points making an open three
+FORBIDDEN_DEPTH = 3
+
+FIVE = "five"
+FORBIDDEN = "forbidden"
+FULL = "full"
+
+
+def parse_move(move_str):
+    """'h8' is (7, 7), like the piskpipe moves."""
+    return ord(move_str[0]) - ord('a'), int(move_str[1:]) - 1
+
+
+def parse_moves(position):
+    return [parse_move(m) for m in re.findall(r"([a-z][1-9][0-9]?)", position.lower())]
+
+
+class Board:
+    """
+    A gomoku board of stones of the first and second player.
+
+    push() places the next stone and judges it in O(1) from the lines
+    through it: a five, a forbidden point of the first player in renju
+    (overline, double four or double three) or a full board.
+    """
+    def __init__(self, size, rule=FREESTYLE, position=""):
+        self.size = size
+        self.rule = rule
+        self.cells = bytearray(size * size)
+        self.count = 0
+        for x, y in parse_moves(position):
+            self.cells[y * size + x] = self.next_color()
+            self.count += 1
+
+    def next_color(self):
+        return FIRST if self.count % 2 == 0 else SECOND
+
+    def at(self, x, y):
+        """The stone at (x, y), None outside the board."""
+        if 0 <= x < self.size and 0 <= y < self.size:
+            return self.cells[y * self.size + x]
+        return None
+
+    def _run(self, x, y, dx, dy, color):
+        """(backward, forward) stones of *color* next to (x, y) along a direction."""
+        back = 0
+        while self.at(x - (back + 1) * dx, y - (back + 1) * dy) == color:
+            back += 1
+        forward = 0
+        while self.at(x + (forward + 1) * dx, y + (forward + 1) * dy) == color:
+            forward += 1
+        return back, forward
+
+    def _wins(self, length, color):
+        if self.rule == FREESTYLE or (self.rule == RENJU and color == SECOND):
+            return length >= 5
+        return length == 5
+
+    def is_legal(self, move_str):
+        try:
+            x, y = parse_move(move_str)
+        except (ValueError, IndexError):
+            return False
+        return self.at(x, y) == EMPTY
+
+    def push(self, move_str):
+        """Place the next stone at *move_str*, return FIVE, FORBIDDEN, FULL or None."""
+        x, y = parse_move(move_str)
+        color = self.next_color()
+        forbidden = color == FIRST and self.rule == RENJU and self._forbidden(x, y, FORBIDDEN_DEPTH)
+        self.cells[y * self.size + x] = color
+        self.count += 1
+        for dx, dy in DIRECTIONS:
+            back, forward = self._run(x, y, dx, dy, color)
+            if self._wins(back + forward + 1, color):
+                return FIVE
+        if forbidden:
+            return FORBIDDEN
+        if self.count == len(self.cells):
+            return FULL
+        return None
+
+    def _completions(self, x, y, dx, dy):
+        """
+        Offsets along a direction of the empty points completing an exact
+        five of the first player through the stone on (x, y).
+        """
+        points = []
+        for k in range(-4, 5):
+            if k == 0 or self.at(x + k * dx, y + k * dy) != EMPTY:
+                continue
+            qx, qy = x + k * dx, y + k * dy
+            self.cells[qy * self.size + qx] = FIRST
+            back, forward = self._run(qx, qy, dx, dy, FIRST)
+            self.cells[qy * self.size + qx] = EMPTY
+            # the five has to contain (x, y)
+            if back + forward + 1 == 5 and -back <= -k <= forward:
+                points.append(k)
+        return points
+
+    @staticmethod
+    def _fours(points):
+        """Number of fours made by the completion points of one line."""
+        if len(points) == 2 and abs(points[0] - points[1]) == 5:
+            return 1  # a straight four
+        return len(points)
+
+    def _open_three(self, x, y, dx, dy, depth):
+        """Whether a stone on some empty point of the line makes a straight four that is allowed."""
+        for k in range(-4, 5):
+            qx, qy = x + k * dx, y + k * dy
+            if k == 0 or self.at(qx, qy) != EMPTY:
+                continue
+            self.cells[qy * self.size + qx] = FIRST
+            points = self._completions(x, y, dx, dy)
+            self.cells[qy * self.size + qx] = EMPTY
+            # the straight four lies between its two completion points and has to contain q
+            if len(points) == 2 and points[1] - points[0] == 5 and points[0] < k < points[1] and \
+                    (depth <= 0 or not self._forbidden(qx, qy, depth - 1)):
+                return True
+        return False
+
+    def _forbidden(self, x, y, depth):
+        """Whether the empty (x, y) is a forbidden point of the first player in renju."""
+        index = y * self.size + x
+        self.cells[index] = FIRST
+        try:
+            overline = False
+            for dx, dy in DIRECTIONS:
+                back, forward = self._run(x, y, dx, dy, FIRST)
+                if back + forward + 1 == 5:
+                    return False  # a five wins before any forbidden point
+                overline = overline or back + forward + 1 > 5
+            if overline:
+                return True
+            fours = 0
+            for dx, dy in DIRECTIONS:
+                fours += self._fours(self._completions(x, y, dx, dy))
+            if fours >= 2:
+                return True
+            threes = 0
+            for dx, dy in DIRECTIONS:
+                if not self._completions(x, y, dx, dy) and self._open_three(x, y, dx, dy, depth):
+                    threes += 1
+            return threes >= 2
+        finally:
+            self.cells[index] = EMPTY
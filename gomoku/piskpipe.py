@@ -4,6 +4,7 @@ import logging
 import threading
 import re
 import time
+
 try:
     import queue
 except ImportError:
@@ -37,6 +38,7 @@ class Command(object):
         self._result = None
         self._done = False
         self._done_callbacks = []
+        self.timestamps = {"enqueue": time.perf_counter_ns()}
 
     def _invoke_callbacks(self):
         for callback in self._done_callbacks:
@@ -95,6 +97,7 @@ class Command(object):
                 raise TimeoutError()
 
     def set_result(self, result):
+        self.timestamps.setdefault("result", time.perf_counter_ns())
         with self._condition:
             self._result = result
             self._done = True
@@ -210,8 +213,9 @@ class TerminationPromise(object):
 
 
 class PopenProcess(object):
-    def __init__(self, command):
+    def __init__(self, command, encoding="gb2312"):
         self.command = command
+        self.encoding = encoding
         self.dead = False
         self._receiving_thread = threading.Thread(target=self._receiving_thread_target)
         self._receiving_thread.daemon = True
@@ -220,25 +224,26 @@ class PopenProcess(object):
         self.engine = engine
         self.process = subprocess.Popen(self.command,
                                         stdout=subprocess.PIPE,
-                                        stdin=subprocess.PIPE,
-                                        bufsize=1,
-                                        universal_newlines=True,
-                                        encoding="gb2312")
+                                        stdin=subprocess.PIPE)
         self._receiving_thread.start()
 
     def _receiving_thread_target(self):
-        while self.is_alive():
+        # Read until EOF rather than polling the process, an exiting engine
+        # must not make this loop spin on empty reads.
+        while True:
             try:
                 line = self.process.stdout.readline()
-                if not line:
-                    continue
+            except (OSError, ValueError):
+                break
+            if not line:
+                break
 
-                self.engine.on_line_received(line.rstrip())
+            try:
+                self.engine.on_bytes_received(line.rstrip())
             except Exception as e:
                 print(f"Error when reading line: {repr(e)}")
-                self.dead = True
-                break
 
+        self.dead = True
         self.engine.on_terminated()
 
     def is_alive(self):
@@ -255,8 +260,7 @@ class PopenProcess(object):
         self.process.stdin.close()
 
     def send_line(self, string):
-        self.process.stdin.write(string)
-        self.process.stdin.write("\n")
+        self.process.stdin.write((string + "\n").encode(self.encoding, errors="replace"))
         self.process.stdin.flush()
 
     def wait_for_return_code(self):
@@ -338,6 +342,7 @@ class SpurProcess(object):
 class Engine(object):
     def __init__(self, process):
         self.process = process
+        self.encoding = getattr(process, "encoding", "utf-8")
         self.process.spawn(self)
         self.options = dict()
         self.queue = queue.Queue()
@@ -355,12 +360,44 @@ class Engine(object):
         self.messages = []
         self.info_handlers = []
         self.message_handlers = []
+        # Records the timestamps of each finished command when set by the
+        # caller, e.g. to a util.latency.LatencyStats.
+        self.latency = None
+        self._current_command = None
         self.stdin_thread.start()
 
     def send_line(self, line):
         LOGGER.debug("%s << %s", self.process, line)
+        self._mark("write")
         return self.process.send_line(line)
 
+    def _mark(self, stage):
+        command = self._current_command
+        if command is not None and stage not in command.timestamps:
+            command.timestamps[stage] = time.perf_counter_ns()
+
+    def _run_command(self, command):
+        self._current_command = command
+        try:
+            command.execute(self)
+        finally:
+            self._current_command = None
+            if self.latency is not None:
+                name = type(command).__name__
+                self.latency.record(name[:-7].lower() if name.endswith("Command") else name, command.timestamps)
+
+    def on_bytes_received(self, buf):
+        command = self._current_command
+        if command is not None and "first_output" not in command.timestamps and "write" in command.timestamps:
+            command.timestamps["first_output"] = time.perf_counter_ns()
+
+        # DEBUG output can be very chatty and is never used, skip decoding it.
+        if buf[:6].upper() == b"DEBUG ":
+            LOGGER.debug("%s >> %r", self.process, buf)
+            return
+
+        self.on_line_received(buf.decode(self.encoding, errors="replace"))
+
     def on_line_received(self, buf):
         LOGGER.debug("%s >> %s", self.process, buf)
 
@@ -399,7 +436,7 @@ class Engine(object):
             if not self.is_alive():
                 break
 
-            command.execute(self)
+            self._run_command(command)
             self.queue.task_done()
 
         self.on_terminated()
@@ -408,11 +445,15 @@ class Engine(object):
         self.process.close_std_streams()
         self.return_code = self.process.wait_for_return_code()
         self.terminated.set()
+        # Release commands waiting for an answer that will never come.
+        self.startok.set()
+        self.bestmove_received.set()
 
     def _startok(self):
         self.startok.set()
 
     def _bestmove(self, arg):
+        self._mark("bestmove")
         moves = [int(coord) for coord in arg.split(',')[:2]]
         self.bestmove = chr(ord('a') + moves[0]) + str(1 + moves[1])
         self.bestmove_received.set()
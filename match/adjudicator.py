@@ -0,0 +1,309 @@
+import time
+
+RESULTS = [WIN, LOSS, DRAW] = range(3)
+
+JOINT_WIN = "joint_win"
+JOINT_DRAW = "joint_draw"
+
+
+class JointAdjudication:
+    """
+    TCEC style adjudication, where both engines have to agree.
+
+    A game is won once the last *win_plies* scores of both engines are at
+    least *win_score* for the same side, and drawn once the last
+    *draw_plies* scores of both engines stay within *draw_score* after ply
+    *draw_start*. A rule with a non positive plies count is off.
+
+    Every rule is tracked on its own: the ply it first fires at is stored in
+    the 'adjudications' of the game record. With *shadow* set the rules only
+    record that ply and never end a game, which measures what they would save.
+    """
+    def __init__(self, win_plies=-1, win_score=1000, draw_plies=-1, draw_score=10, draw_start=0, shadow=False):
+        self.win_plies = win_plies
+        self.win_score = win_score
+        self.draw_plies = draw_plies
+        self.draw_score = draw_score
+        self.draw_start = draw_start
+        self.shadow = shadow
+
+    @classmethod
+    def from_options(cls, options):
+        """From a task option dict, None if there is none."""
+        return cls(**options) if options else None
+
+
+class Adjudicator:
+    """
+    Incremental adjudication of one game, shared by all match drivers.
+
+    Drivers feed every move into add_move(), which records it and applies
+    the mate, score window, variant, clock and move count rules with O(1)
+    work per ply. It returns (result, game_record) from white's point of view
+    once the game is over, else None.
+
+    Variant rules are given as *position_rule(index, bestmove)*, called for
+    every played move after the score rules. It returns an outcome built with
+    draw(), win() or loss(), or None to continue.
+    """
+    def __init__(self, match, white, limits, game_record, position_rule=None, mate1_judge=False,
+                 admit_any_mate=False, draw_after=None, compact_moves=False):
+        self.match = match
+        self.white = white
+        self.limits = limits
+        self.game_record = game_record
+        self.bestmoves = game_record['bestmoves']
+        self.position_rule = position_rule
+        self.mate1_judge = mate1_judge
+        self.admit_any_mate = admit_any_mate
+        self.compact_moves = compact_moves
+        self.draw_after = match.draw_after if draw_after is None else draw_after
+        self.draw_as_black_win = getattr(match, 'draw_as_black_win', False)
+        self.draw_move_limit = match.draw_move_limit
+        self.draw_score_limit = match.draw_score_limit
+        self.win_move_limit = match.win_move_limit
+        self.win_score_limit = match.win_score_limit
+        self.inc = match.inc
+        self.nodestime = match.nodestime
+        self.time_losses = match.time_losses
+        self.win_move_count = 0
+        self.loss_move_count = 0
+        self.draw_move_count = 0
+        self.joint = getattr(match, 'joint_adjudication', None)
+        if self.joint is not None:
+            # per engine runs of consecutive white point of view scores for each rule
+            self.joint_win_runs = [0, 0]
+            self.joint_loss_runs = [0, 0]
+            self.joint_draw_runs = [0, 0]
+            game_record['adjudications'] = {}
+
+    def _end(self, res, result, comment):
+        self.game_record['result'] = result
+        self.game_record['comment'] = comment
+        return res, self.game_record
+
+    def draw(self, comment, reason=None):
+        """A drawn game, or a black win in draw as black win mode."""
+        if self.draw_as_black_win:
+            reason = f" ({reason})" if reason else ""
+            return self._end(LOSS, -1, f'Lose by draw{reason} (draw as black win)')
+        return self._end(DRAW, 0, comment)
+
+    def win(self, index, comment):
+        """A win for engine *index*, *comment* is from white's point of view."""
+        return self._end(WIN, 1, comment) if index == self.white else self._end(LOSS, -1, comment)
+
+    def loss(self, index, comment):
+        """A loss for engine *index*, *comment* is from white's point of view."""
+        return self._end(LOSS, -1, comment) if index == self.white else self._end(WIN, 1, comment)
+
+    def deadline_loss(self, index):
+        self.time_losses[index] += 1
+        if index == self.white:
+            return self._end(LOSS, -2, 'Lose by deadline timeout')
+        return self._end(WIN, 2, 'Lose by deadline timeout')
+
+    def add_move(self, index, results, time_used):
+        if results == 'timeout':
+            return self.deadline_loss(index)
+
+        bestmove = results['bestmove']
+        score = results.get('score')
+        if self.compact_moves:
+            self.game_record['moves'].append((bestmove, score, time_used))
+        elif bestmove != "(none)":
+            self.game_record['moves'].append({
+                'move': bestmove,
+                'score': score,
+                'time': results.get('time'),
+                'rtime': time_used,
+                'depth': results.get('depth'),
+                'seldepth': results.get('seldepth'),
+                'nodes': results.get('nodes'),
+                'nps': results.get('nps'),
+                'hashfull': results.get('hashfull'),
+            })
+        self.bestmoves.append(bestmove)
+
+        match = self.match
+        if match.verbosity > 1:
+            match.out.write(f"Engine {index} ({time_used} ms): {results}\n")
+
+        outcome = self._judge_score(index, results, score)
+        if outcome is None and self.joint is not None and score is not None:
+            outcome = self._judge_joint(index, score)
+        if outcome is None and self.position_rule is not None and bestmove != "(none)":
+            outcome = self.position_rule(index, bestmove)
+        if outcome is None:
+            outcome = self._judge_clock(index, results, time_used)
+        return outcome
+
+    def _judge_score(self, index, results, score):
+        # only recognize the mate admitted by the losing side
+        mate = results.get('mate', 0)
+        if mate == -1 or (self.admit_any_mate and mate < 0):
+            return self.loss(index, 'Lose by mate' if index == self.white else 'Win by mate')
+        elif self.mate1_judge and mate == 1:
+            return self.win(index, 'Win by mate' if index == self.white else 'Lose by mate')
+        elif score is None:
+            return None
+
+        white_score = score if index == self.white else -score
+        # check for end of game draw conditions
+        if white_score == 0 and 'pv' in results and len(results['pv']) == 0:
+            return self.draw('Draw by end of game')
+        # check for draw adjudication
+        elif self.draw_move_limit > 0 and abs(white_score) <= self.draw_score_limit:
+            self.draw_move_count += 1
+            if self.draw_move_count >= self.draw_move_limit:
+                return self.draw(f'Draw by score <= {self.draw_score_limit} for {self.draw_move_limit} moves')
+        # check for win adjudication for white perspective
+        elif self.win_move_limit > 0 and white_score >= self.win_score_limit:
+            self.win_move_count += 1
+            if self.win_move_count >= self.win_move_limit:
+                return self._end(WIN, 1, f'Win by score >= {self.win_score_limit} for {self.win_move_limit} moves')
+        # check for loss adjudication for white perspective
+        elif self.win_move_limit > 0 and white_score <= -self.win_score_limit:
+            self.loss_move_count += 1
+            if self.loss_move_count >= self.win_move_limit:
+                return self._end(LOSS, -1, f'Loss by score <= {-self.win_score_limit} for {self.win_move_limit} moves')
+        # refresh move counters
+        else:
+            self.win_move_count = 0
+            self.loss_move_count = 0
+            self.draw_move_count = 0
+        return None
+
+    def _fire(self, rule):
+        """Record the first ply *rule* fires at, return whether it may end the game."""
+        self.game_record['adjudications'].setdefault(rule, len(self.bestmoves))
+        return not self.joint.shadow
+
+    def _judge_joint(self, index, score):
+        joint = self.joint
+        white_score = score if index == self.white else -score
+        if joint.win_plies > 0:
+            self.joint_win_runs[index] = self.joint_win_runs[index] + 1 if white_score >= joint.win_score else 0
+            self.joint_loss_runs[index] = self.joint_loss_runs[index] + 1 if white_score <= -joint.win_score else 0
+            if min(self.joint_win_runs) >= joint.win_plies and self._fire(JOINT_WIN):
+                return self._end(WIN, 1, f'Win by joint score >= {joint.win_score} for {joint.win_plies} moves')
+            if min(self.joint_loss_runs) >= joint.win_plies and self._fire(JOINT_WIN):
+                return self._end(LOSS, -1, f'Loss by joint score <= {-joint.win_score} for {joint.win_plies} moves')
+        if joint.draw_plies > 0:
+            self.joint_draw_runs[index] = self.joint_draw_runs[index] + 1 if abs(white_score) <= joint.draw_score else 0
+            if len(self.bestmoves) >= joint.draw_start and min(self.joint_draw_runs) >= joint.draw_plies \
+                    and self._fire(JOINT_DRAW):
+                return self.draw(f'Draw by joint score <= {joint.draw_score} for {joint.draw_plies} moves',
+                                 'joint score')
+        return None
+
+    def _judge_clock(self, index, results, time_used):
+        # adjust time remaining on clock and check time loss
+        limits = self.limits
+        if limits['wtime'] is not None and limits['btime'] is not None:
+            if self.nodestime > 0:
+                used = int(results.get("time") / self.nodestime)
+            else:
+                used = results.get("time", time_used)
+            if index == self.white:
+                limits['wtime'] += self.inc - used
+                if limits['wtime'] < 0:
+                    self.time_losses[index] += 1
+                    return self._end(LOSS, -2, 'Lose by Time loss')
+            else:
+                limits['btime'] += self.inc - used
+                if limits['btime'] < 0:
+                    self.time_losses[index] += 1
+                    return self._end(WIN, 2, 'Win by time loss')
+
+        # check for draw by total move count
+        if 0 <= self.draw_after <= len(self.bestmoves):
+            return self.draw(f'Draw by move count >= {self.draw_after}', f'move count >= {self.draw_after}')
+        return None
+
+
+class Rule60:
+    """
+    Repetition and rule60 bookkeeping of the xiangqi-like drivers in O(1) per ply.
+
+    Keeps the positions and the number of plies since the last capture, and
+    the checks given by each side. Checks beyond CHECK_LIMIT of a side do not
+    count towards the PLY_LIMIT plies of the rule.
+    """
+    CHECK_LIMIT = 10
+    PLY_LIMIT = 120
+    REPETITION_LIMIT = 2
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Forget everything, called on a capture."""
+        self.positions = {}
+        self.plies = 0
+        self.checks = {'w': 0, 'b': 0}
+        self.overflow_checks = 0
+
+    def add_check(self, side):
+        """Count a check given by *side*."""
+        self.checks[side] += 1
+        if self.checks[side] > self.CHECK_LIMIT:
+            self.overflow_checks += 1
+
+    def add_position(self, key, checking_side=None):
+        """
+        Count a non-capture ply reaching the position *key*, given check by
+        *checking_side* if any. Return 'repetition', 'rule60' or None.
+        """
+        count = self.positions.get(key, 0)
+        if count >= self.REPETITION_LIMIT:
+            return 'repetition'
+        self.positions[key] = count + 1
+        self.plies += 1
+        if checking_side is not None:
+            self.add_check(checking_side)
+        if self.plies - self.overflow_checks * 2 >= self.PLY_LIMIT:
+            return 'rule60'
+        return None
+
+    def judge(self, adjudicator, key, checking_side=None):
+        """add_position() ending the game with *adjudicator* on a draw."""
+        rule = self.add_position(key, checking_side)
+        if rule == 'repetition':
+            return adjudicator.draw('Draw by repetition', 'repetition')
+        elif rule == 'rule60':
+            return adjudicator.draw('Draw by rule60', 'rule60')
+        return None
+
+
+class _BenchMatch:
+    verbosity = 0
+    draw_after = -1
+    draw_move_limit = 10
+    draw_score_limit = 5
+    win_move_limit = 10
+    win_score_limit = 1000
+    inc = 100
+    nodestime = 0
+
+    def __init__(self):
+        self.time_losses = [0, 0]
+
+
+def benchmark(plies=200000):
+    """Feed synthetic moves into an Adjudicator and return the nanoseconds spent per ply."""
+    match = _BenchMatch()
+    limits = {'wtime': 10 ** 12, 'btime': 10 ** 12, 'winc': 100, 'binc': 100}
+    game_record = {'moves': [], 'result': None, 'bestmoves': [], 'comment': ''}
+    adjudicator = Adjudicator(match, 0, limits, game_record)
+    results = [{'bestmove': 'h2e2', 'score': score, 'mate': 0, 'pv': ['h2e2'], 'time': 10}
+               for score in (30, -40, 120, -80)]
+    start = time.perf_counter_ns()
+    for ply in range(plies):
+        if adjudicator.add_move(ply & 1, results[ply & 3], 10) is not None:
+            raise Exception(f"Benchmark game ended at ply {ply}")
+    return (time.perf_counter_ns() - start) / plies
+
+
+if __name__ == "__main__":
+    print(f"{benchmark():.0f} ns per ply")
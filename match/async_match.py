@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import time
+
+import chess.engine
+import chess.uci
+
+LOGGER = logging.getLogger(__name__)
+
+QUIT_TIMEOUT = 5.0
+
+INFO_INT_FIELDS = ("depth", "seldepth", "nodes", "nps", "hashfull", "time")
+INFO_KEYWORDS = frozenset(INFO_INT_FIELDS + ("multipv", "score", "pv", "currmove", "currmovenumber", "tbhits",
+                                             "cpuload", "string", "refutation", "currline", "sbhits", "wdl"))
+
+
+class MatchUciProtocol(chess.engine.UciProtocol):
+    """A UciProtocol for the match engines, which are not restricted to utf-8 output."""
+    encoding = "gb2312"
+
+    def send_line(self, line):
+        self.send_lines([line])
+
+    def send_lines(self, lines):
+        for line in lines:
+            LOGGER.debug("%s: << %s", self, line)
+        data = "".join(line + "\n" for line in lines)
+        self.transport.get_pipe_transport(0).write(data.encode(self.encoding, errors="replace"))
+
+    def pipe_data_received(self, fd, data):
+        self.buffer[fd].extend(data)
+        while b"\n" in self.buffer[fd]:
+            line_bytes, self.buffer[fd] = self.buffer[fd].split(b"\n", 1)
+            line = line_bytes.rstrip(b"\r").decode(self.encoding, errors="replace")
+            if fd == 1:
+                self.loop.call_soon(self._line_received, line)
+            else:
+                self.loop.call_soon(self.error_line_received, line)
+
+
+class LinesCommand(chess.engine.BaseCommand):
+    """
+    Write raw lines in one go and wait for 'readyok' or 'bestmove'.
+    While searching, only the latest scored info line of the first pv is
+    kept and parsed once the bestmove arrives.
+    """
+    def __init__(self, lines, until):
+        super().__init__()
+        self.lines = lines
+        self.until = until
+        self.info_line = None
+        self.info_string = None
+
+    def start(self, engine):
+        engine.send_lines(self.lines)
+
+    def line_received(self, engine, line):
+        if self.until == "bestmove":
+            if line.startswith("info "):
+                if line.startswith("info string "):
+                    self.info_string = line[12:]
+                elif " score " in line and (" multipv " not in line or " multipv 1 " in line):
+                    self.info_line = line
+            elif line.startswith("bestmove"):
+                tokens = line.split()
+                self.result.set_result((tokens[1] if len(tokens) > 1 else "(none)",
+                                        parse_info(self.info_line), self.info_string))
+                self.set_finished()
+        elif line.strip() == self.until:
+            self.result.set_result(None)
+            self.set_finished()
+
+    def cancel(self, engine):
+        if self.until == "bestmove":
+            engine.send_line("stop")
+
+
+def parse_info(line):
+    """Parse the fields of an info line used by the match, with moves kept as strings."""
+    info = {}
+    if not line:
+        return info
+    tokens = line.split()[1:]
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in INFO_INT_FIELDS and i + 1 < len(tokens):
+            try:
+                info[token] = int(tokens[i + 1])
+            except ValueError:
+                pass
+            i += 2
+        elif token == "score" and i + 2 < len(tokens):
+            try:
+                info[tokens[i + 1]] = int(tokens[i + 2])
+            except ValueError:
+                pass
+            i += 3
+        elif token == "pv":
+            info["pv"] = []
+            i += 1
+            while i < len(tokens) and tokens[i] not in INFO_KEYWORDS:
+                info["pv"].append(tokens[i])
+                i += 1
+        else:
+            i += 1
+    return info
+
+
+def go_line(limits):
+    builder = ["go"]
+    for key in ("wtime", "btime", "winc", "binc", "depth", "nodes", "movetime"):
+        if limits.get(key) is not None and limits[key] >= 0:
+            builder.append(key)
+            builder.append(str(int(limits[key])))
+    return " ".join(builder)
+
+
+class AsyncUciEngine:
+    """
+    A UCI engine on an asyncio subprocess transport.
+    Like the pipelined chess.uci engines, ucinewgame, setoption and position
+    are written together with the next go, and unchanged options are not sent.
+    """
+    def __init__(self, transport, protocol):
+        self.transport = transport
+        self.protocol = protocol
+        self.sent_options = chess.uci.OptionMap()
+        self.position_builder = None
+        self.killed = False
+        self._pending_lines = []
+
+    @classmethod
+    async def popen(cls, command, options=None):
+        transport, protocol = await MatchUciProtocol.popen(command)
+        try:
+            await protocol.initialize()
+        except BaseException:
+            transport.close()
+            raise
+        engine = cls(transport, protocol)
+        engine.setoption(options or {})
+        await engine.isready()
+        return engine
+
+    def setoption(self, options):
+        for name, value in options.items():
+            new = chess.uci.option_value(value)
+            if value is not None and self.sent_options.get(name) == new:
+                continue
+            self.sent_options[name] = new
+            self._pending_lines.append(f"setoption name {name} value {new}")
+
+    def new_game(self, position, options=None):
+        self._pending_lines.append("ucinewgame")
+        self.setoption(options or {})
+        self.position_builder = chess.uci.PositionBuilder(position)
+
+    def _take_lines(self, lines):
+        lines, self._pending_lines = self._pending_lines + lines, []
+        return lines
+
+    async def isready(self):
+        lines = self._take_lines(["isready"])
+        await self.protocol.communicate(lambda: LinesCommand(lines, "readyok"))
+
+    async def go(self, bestmoves, limits):
+        """:return: (bestmove, info dict, last info string)"""
+        lines = self._take_lines([self.position_builder.update(bestmoves).buf, go_line(limits)])
+        return await self.protocol.communicate(lambda: LinesCommand(lines, "bestmove"))
+
+    def is_alive(self):
+        return not self.killed and not self.protocol.returncode.done()
+
+    def kill(self):
+        if self.is_alive():
+            self.killed = True
+            try:
+                self.transport.kill()
+            except ProcessLookupError:
+                pass
+
+    async def quit(self):
+        if not self.is_alive():
+            self.transport.close()
+            return
+        try:
+            await asyncio.wait_for(self.protocol.quit(), QUIT_TIMEOUT)
+        except (asyncio.TimeoutError, chess.engine.EngineError):
+            self.kill()
+        finally:
+            self.transport.close()
+
+
+class AsyncMatchRunner:
+    """
+    Play the games of a UCI match driver as coroutines on one asyncio event loop.
+
+    Every concurrent game slot owns a pair of engines on subprocess
+    transports, so no reader threads are created per engine. Each move is bounded
+    by asyncio.wait_for, a hung engine loses the game and is replaced.
+    The driver supplies the limits, its variant rules through
+    new_adjudicator and the result bookkeeping, its threaded engines are
+    not used.
+    """
+    def __init__(self, match):
+        self.match = match
+        if not match.time_losses:
+            match.time_losses = [0, 0]
+
+    async def _spawn_engines(self):
+        match = self.match
+        return await asyncio.gather(*(AsyncUciEngine.popen(path, options)
+                                      for path, options in zip(match.engine_paths, match.engine_options)))
+
+    async def _play_move(self, engine, bestmoves, limits):
+        try:
+            bestmove, info, info_string = await asyncio.wait_for(engine.go(bestmoves, limits),
+                                                                 self.match.move_deadline(limits))
+        except asyncio.TimeoutError:
+            engine.kill()
+            return self.match.deadline_timeout(bestmoves)
+
+        if info_string and 'classical' in info_string:
+            raise Exception("Failed loading NNUE")
+        if 'cp' not in info and 'mate' not in info:
+            raise Exception("Engine does not return a score.\nMoves: " + " ".join(bestmoves))
+        score = info.get('cp')
+        mate = info['mate'] if score is None else 0
+        score = 30000 - mate if mate > 0 else -30000 - mate if mate < 0 else score
+        return {
+            "bestmove": bestmove,
+            "score": score,
+            "mate": mate,
+            "pv": info.get("pv", []),
+            "depth": info.get("depth", -1),
+            "seldepth": info.get("seldepth", -1),
+            "nodes": info.get("nodes", -1),
+            "nps": info.get("nps", -1),
+            "hashfull": info.get("hashfull", -1),
+            "time": info.get("time", -1),
+        }
+
+    async def play_one_game(self, engines, white, black, pos):
+        """Coroutine version of EngineMatch._play_one_game on the given engine pair."""
+        match = self.match
+        limits = match._new_limits()
+        position = pos if pos.startswith("fen ") or pos == "startpos" else "fen " + pos
+        for engine in engines:
+            engine.new_game(position, match.game_options)
+        adjudicator = match.new_adjudicator(white, black, pos, limits)
+        bestmoves = adjudicator.bestmoves
+        opening_offset = match.get_offset_from_pos(pos)
+        while True:
+            index = white if (opening_offset + len(bestmoves)) % 2 == 0 else black
+
+            start_time = time.time()
+            results = await self._play_move(engines[index], bestmoves, limits)
+            time_used = int((time.time() - start_time) * 1000)
+
+            outcome = adjudicator.add_move(index, results, time_used)
+            if outcome is not None:
+                return outcome
+
+    async def _game_slot(self, games, outcomes):
+        engines = None
+        try:
+            while games:
+                number, (white, black, pos) = games.pop()
+                if engines is None or not all(engine.is_alive() for engine in engines):
+                    if engines is not None:
+                        await asyncio.gather(*(engine.quit() for engine in engines))
+                    engines = await self._spawn_engines()
+                try:
+                    res, game_record = await self.play_one_game(engines, white, black, pos)
+                    outcomes[number] = self.match._record_result(white, pos, res, game_record)
+                except Exception as e:
+                    LOGGER.exception("game %d failed", number)
+                    outcomes[number] = e
+                    for engine in engines:
+                        engine.kill()
+        finally:
+            if engines is not None:
+                await asyncio.gather(*(engine.quit() for engine in engines))
+
+    async def run_games_async(self, games, concurrency=None):
+        """
+        Play (white, black, pos) games with up to *concurrency* games at a time.
+        :return: one ("win"|"lose"|"draw", game_record) per game in order, or the exception it failed with
+        """
+        pending = list(reversed(list(enumerate(games))))
+        outcomes = [None] * len(pending)
+        slots = min(concurrency or len(pending), len(pending))
+        await asyncio.gather(*(self._game_slot(pending, outcomes) for _ in range(slots)))
+        return outcomes
+
+    def run_games(self, games, concurrency=None):
+        """Play games on a new event loop, see run_games_async."""
+        return asyncio.run(self.run_games_async(games, concurrency))
+
+    def run_game(self, white, black, pos):
+        """Like EngineMatch.run_game, raising the exception a failed game ended with."""
+        outcome, = self.run_games([(white, black, pos)])
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
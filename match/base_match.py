@@ -4,12 +4,25 @@ import logging
 import time
 from abc import abstractmethod
 
-RESULTS = [WIN, LOSS, DRAW] = range(3)
+import util.binary_prep as binary_prep
+import util.watchdog as watchdog
+from match.adjudicator import Adjudicator, WIN, LOSS, DRAW
+
 SCORES = [1, 0, 0.5]
 
+# Seconds a move may exceed the clock before the engine is killed, and the
+# deadline of searches that are not limited by time.
+DEADLINE_TOLERANCE = 5.0
+UNTIMED_DEADLINE = 600.0
+
 
 class EngineMatch:
     """The base class to run an engine match."""
+    # adjudication options of the variant, see Adjudicator
+    mate1_judge = False
+    admit_any_mate = False
+    compact_moves = False
+
     def __init__(self,
                  variant,
                  engine1,
@@ -27,7 +40,8 @@ class EngineMatch:
                  draw_score_limit=-1,
                  win_move_limit=-1,
                  win_score_limit=-1,
-                 verbosity=0):
+                 verbosity=0,
+                 joint_adjudication=None):
         self.variant = variant
         self.engine1 = engine1
         self.engine2 = engine2
@@ -49,16 +63,18 @@ class EngineMatch:
         self.draw_score_limit = draw_score_limit
         self.win_move_limit = win_move_limit
         self.win_score_limit = win_score_limit
+        # a JointAdjudication, or None
+        self.joint_adjudication = joint_adjudication
+        # UCI options sent before every game, like UCI_Variant
+        self.game_options = {}
 
         self.engines = []
         self.time_losses = []
         self.scores = [0, 0, 0]
         self.r = []
 
-        # check if it's not on Windows
-        if os.name != 'nt':
-            os.system("chmod +x " + self.engine1)
-            os.system("chmod +x " + self.engine2)
+        binary_prep.make_executable(self.engine1)
+        binary_prep.make_executable(self.engine2)
 
         if self.verbosity > 2:
             logging.basicConfig(level=logging.DEBUG if self.verbosity > 3 else logging.INFO)
@@ -83,29 +99,31 @@ class EngineMatch:
     def destroy_engines(self):
         """Destroy all engines."""
         for engine in self.engines:
+            if self.verbosity > 1 and getattr(engine, "latency", None) is not None:
+                self.out.write(f"Command latency of {engine}:\n{engine.latency.format()}\n")
             self.do_destroy_engine(engine)
 
-    def _play_one_game(self, white, black, pos):
-        """Play a game and return the game result from white's point of view."""
-        limits = {
-            'wtime': self.time,
-            'btime': self.time,
+    def _new_limits(self):
+        return {
+            'wtime': self.time if self.time > 0 else None,
+            'btime': self.time if self.time > 0 else None,
             'winc': self.inc,
             'binc': self.inc,
             'depth': self.depth,
             'nodes': self.nodes,
             'movetime': self.movetime
         }
+
+    def _play_one_game(self, white, black, pos):
+        """Play a game and return the game result from white's point of view."""
+        limits = self._new_limits()
         for index, engine in enumerate(self.engines):
             if self.verbosity > 1:
                 self.out.write(f'Engine {index} init: pos="{pos}" limits={limits}\n')
             self.do_init_game(engine, pos, limits)
+        adjudicator = self.new_adjudicator(white, black, pos, limits)
+        bestmoves = adjudicator.bestmoves
         opening_offset = self.get_offset_from_pos(pos)
-        win_move_count = 0
-        loss_move_count = 0
-        draw_move_count = 0
-        bestmoves = []
-        game_record = {'fen': pos, 'moves': [], 'result': None, 'bestmoves': bestmoves}
         while True:
             index = white if (opening_offset + len(bestmoves)) % 2 == 0 else black
             engine = self.engines[index]
@@ -114,82 +132,32 @@ class EngineMatch:
             results = self.do_play_game(engine, pos, bestmoves, limits)
             time_used = int((time.time() - start_time) * 1000)
 
-            if results == 'timeout':
-                self.time_losses[index] += 1
-                game_record['result'] = -2 if index == white else 2
-                game_record['comment'] = 'Lose by deadline timeout'
-                return LOSS, game_record
+            outcome = adjudicator.add_move(index, results, time_used)
+            if outcome is not None:
+                return outcome
 
-            # record engine's move
-            score = results.get('score', None)
-            game_record['moves'].append((results['bestmove'], score, time_used))
-            bestmoves.append(results['bestmove'])
+    def new_adjudicator(self, white, black, pos, limits):
+        """The Adjudicator of a new game from *pos*, judging the variant rules of make_position_rule."""
+        game_record = {'order': white, 'fen': pos, 'moves': [], 'result': None, 'bestmoves': [], 'comment': ''}
+        adjudicator = Adjudicator(self, white, limits, game_record, mate1_judge=self.mate1_judge,
+                                  admit_any_mate=self.admit_any_mate, compact_moves=self.compact_moves)
+        adjudicator.position_rule = self.make_position_rule(adjudicator, white, black, pos)
+        return adjudicator
 
-            if self.verbosity > 1:
-                self.out.write(f"Engine {index} ({time_used} ms): {results}\n")
-
-            # check for mate (only recognize the mate admitted by the losing side)
-            if results.get('mate', 0) < 0:
-                if index == white:
-                    game_record['result'] = -1
-                    return LOSS, game_record
-                else:
-                    game_record['result'] = 1
-                    return WIN, game_record
-            elif score is not None:
-                white_score = score if index == white else -score
-                # check for end of game draw conditions
-                if white_score == 0 and 'pv' in results and len(results['pv']) == 0:
-                    game_record['result'] = 0
-                    return DRAW, game_record
-                # check for draw adjudication
-                elif self.draw_move_limit > 0 and abs(white_score) <= self.draw_score_limit:
-                    draw_move_count += 1
-                    if draw_move_count >= self.draw_move_limit:
-                        game_record['result'] = 0
-                        return DRAW, game_record
-                # check for win adjudication for white perspective
-                elif self.win_move_limit > 0 and white_score >= self.win_score_limit:
-                    win_move_count += 1
-                    if win_move_count >= self.win_move_limit:
-                        return (WIN if index == white else LOSS), game_record
-                # check for loss adjudication for white perspective
-                elif self.win_move_limit > 0 and white_score <= -self.win_score_limit:
-                    loss_move_count += 1
-                    if loss_move_count >= self.win_move_limit:
-                        return (LOSS if index == white else WIN), game_record
-                # refresh move counters
-                else:
-                    win_move_count = 0
-                    loss_move_count = 0
-                    draw_move_count = 0
-
-            # adjust time remaining on clock and check time loss
-            if limits['wtime'] is not None and limits['btime'] is not None:
-                if index == white:
-                    limits['wtime'] += self.inc - results.get('time', time_used)
-                    if limits['wtime'] < 0:
-                        self.time_losses[index] += 1
-                        game_record['result'] = -2
-                        game_record['comment'] = 'Lose by timeout'
-                        return LOSS, game_record
-                else:
-                    limits['btime'] += self.inc - results.get('time', time_used)
-                    if limits['btime'] < 0:
-                        self.time_losses[index] += 1
-                        game_record['result'] = 2
-                        game_record['comment'] = 'Lose by timeout'
-                        return WIN, game_record
-
-            # check for draw by total move count
-            if self.draw_after >= 0 and len(bestmoves) >= self.draw_after:
-                game_record['result'] = 0
-                game_record['comment'] = f'Draw by move count >= {self.draw_after}'
-                return DRAW, game_record
+    def make_position_rule(self, adjudicator, white, black, pos):
+        """
+        Overwrite: Set up the variant rules of a new game and return its
+        position_rule(index, bestmove) for *adjudicator*, or None.
+        Called after do_init_game, before the first move.
+        """
+        return None
 
     def run_game(self, white, black, pos):
         """Run a game, record and return the result."""
         res, game_record = self._play_one_game(white, black, pos)
+        return self._record_result(white, pos, res, game_record)
+
+    def _record_result(self, white, pos, res, game_record):
         if self.verbosity > 0:
             self.out.write(f"Game {sum(self.scores) + 1} ({self.variant}):\nPos: {pos}\n"
                            f"Bestmoves: {' '.join(game_record['bestmoves'])}\n")
@@ -206,6 +174,38 @@ class EngineMatch:
         else:
             return "lose", game_record
 
+    def move_deadline(self, limits):
+        """Seconds the engine to move may think before it is considered hung."""
+        if limits['movetime'] and limits['movetime'] > 0:
+            return limits['movetime'] * 0.001 + DEADLINE_TOLERANCE
+        elif limits['wtime'] is not None and limits['btime'] is not None:
+            time_left = max(limits['wtime'] + (limits['winc'] or 0), limits['btime'] + (limits['binc'] or 0))
+            return time_left * 0.001 + DEADLINE_TOLERANCE
+        return UNTIMED_DEADLINE
+
+    def watch_move(self, engine, limits):
+        """
+        Register the deadline of the next move with the process wide watchdog,
+        which kills the engine when it expires. Use as a context manager around
+        the search and check *expired* afterwards.
+        """
+        return watchdog.get_watchdog().watch(self.move_deadline(limits), lambda: self.do_kill_engine(engine))
+
+    def deadline_timeout(self, bestmoves):
+        """The result of do_play_game for a move killed by the watchdog."""
+        if self.verbosity > 0:
+            self.out.write("Force killed timeout engine. Moves: " + " ".join(bestmoves) + "\n")
+        return 'timeout'
+
+    def do_kill_engine(self, engine):
+        """Kill a hung engine without waiting, called from the watchdog thread."""
+        engine.kill(_async=True)
+
+    def on_option_changed(self, name, old, new):
+        """Called when an engine option that is expensive to change, like Hash, gets a new value."""
+        if self.verbosity > 0:
+            self.out.write(f"Engine option {name} changed from {old} to {new}\n")
+
     @abstractmethod
     def do_init_engine(self, engine_path, engine_options):
         """Overwrite: Initialize an engine from path and returns the engine object."""
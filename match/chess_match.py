@@ -1,10 +1,74 @@
 import logging
-import time
+import threading
 import chess
+import chess.polyglot
+import chess.syzygy
+import util.latency as latency
 from match.base_match import EngineMatch
 
-RESULTS = [WIN, LOSS, DRAW] = range(3)
-SCORES = [1, 0, 0.5]
+_tablebases = {}
+_tablebases_lock = threading.Lock()
+
+
+def get_tablebase(tb_path):
+    """
+    Open the syzygy WDL tables in *tb_path* once per process.
+    :return: (tablebase, largest piece count of its tables)
+    """
+    with _tablebases_lock:
+        if tb_path not in _tablebases:
+            tablebase = chess.syzygy.open_tablebase(tb_path, load_dtz=False)
+            max_pieces = max((len(key) - 1 for key in tablebase.wdl), default=0)
+            _tablebases[tb_path] = tablebase, max_pieces
+        return _tablebases[tb_path]
+
+
+class RepetitionCounter:
+    """
+    Counts the occurrences of the positions since the last capture or pawn
+    move by their polyglot Zobrist key. The piece part of the key is updated
+    incrementally, so each ply costs the same however long the game is.
+    """
+    hasher = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+
+    def __init__(self, board):
+        self.board_key = self.hasher.hash_board(board)
+        self.counts = {self._key(board): 1}
+
+    def _piece_key(self, piece, square):
+        return self.hasher.array[64 * ((piece.piece_type - 1) * 2 + piece.color) + square]
+
+    def _key(self, board):
+        return (self.board_key ^ self.hasher.hash_castling(board) ^
+                self.hasher.hash_ep_square(board) ^ self.hasher.hash_turn(board))
+
+    def push(self, board, move):
+        """Push *move* on *board* and return how often the new position occurred."""
+        if board.is_castling(move):
+            board.push(move)
+            self.board_key = self.hasher.hash_board(board)
+        else:
+            piece = board.piece_at(move.from_square)
+            key = self.board_key ^ self._piece_key(piece, move.from_square)
+            if board.is_en_passant(move):
+                square = move.to_square - 8 if board.turn == chess.WHITE else move.to_square + 8
+                key ^= self._piece_key(chess.Piece(chess.PAWN, not board.turn), square)
+            else:
+                captured = board.piece_at(move.to_square)
+                if captured:
+                    key ^= self._piece_key(captured, move.to_square)
+            if move.promotion:
+                piece = chess.Piece(move.promotion, board.turn)
+            self.board_key = key ^ self._piece_key(piece, move.to_square)
+            board.push(move)
+
+        # no position before an irreversible move can occur again
+        if board.halfmove_clock == 0:
+            self.counts = {}
+        key = self._key(board)
+        count = self.counts.get(key, 0) + 1
+        self.counts[key] = count
+        return count
 
 
 class ChessEngineMatch(EngineMatch):
@@ -27,180 +91,72 @@ class ChessEngineMatch(EngineMatch):
                  win_score_limit=-1,
                  draw_as_black_win=False,
                  mate1_judge=False,
-                 verbosity=0):
+                 tb_path=None,
+                 verbosity=0,
+                 joint_adjudication=None):
         import chess.uci
         super().__init__("chess", engine1, engine2, e1_options, e2_options, time, inctime, depth,
                          nodes, movetime, nodestime, draw_after, draw_move_limit, draw_score_limit,
-                         win_move_limit, win_score_limit, verbosity)
+                         win_move_limit, win_score_limit, verbosity,
+                         joint_adjudication=joint_adjudication)
         if self.verbosity > 2:
             chess.uci.LOGGER.setLevel(logging.DEBUG)
         self.draw_as_black_win = draw_as_black_win
         self.mate1_judge = mate1_judge
+        # chess games end by the fifty move rule instead of a move count
+        self.draw_after = -1
+        # adjudicate by syzygy WDL tables once the position is in range
+        self.tablebase, self.tb_pieces = get_tablebase(tb_path) if tb_path else (None, 0)
+
+    def probe_tablebase(self, board):
+        """WDL of *board* for the side to move, or None if the tables do not cover it."""
+        if self.tablebase is None or board.castling_rights or \
+                chess.popcount(board.occupied) > self.tb_pieces:
+            return None
+        return self.tablebase.get_wdl(board)
 
     @staticmethod
     def get_oppo(side):
         return 'w' if side == 'b' else 'b'
 
-    def _play_one_game(self, white, black, pos):
-        """Play a game and return the game result from white's point of view."""
-        limits = {
-            'wtime': self.time if self.time > 0 else None,
-            'btime': self.time if self.time > 0 else None,
-            'winc': self.inc,
-            'binc': self.inc,
-            'depth': self.depth,
-            'nodes': self.nodes,
-            'movetime': self.movetime
-        }
-        for index, engine in enumerate(self.engines):
-            if self.verbosity > 1:
-                self.out.write(f'Engine {index} init: pos="{pos}" limits={limits}\n')
-            self.do_init_game(engine, pos, limits)
-        opening_offset = self.get_offset_from_pos(pos)
-        win_move_count = 0
-        loss_move_count = 0
-        draw_move_count = 0
-        bestmoves = []
+    def make_position_rule(self, adjudicator, white, black, pos):
         board = chess.Board(pos)
-        game_record = {'order': white, 'fen': pos, 'moves': [], 'result': None, 'bestmoves': bestmoves, 'comment': ''}
-        while True:
-            index = white if (opening_offset + len(bestmoves)) % 2 == 0 else black
-            engine = self.engines[index]
-
-            start_time = time.time()
-            results = self.do_play_game(engine, pos, bestmoves, limits)
-            time_used = int((time.time() - start_time) * 1000)
-
-            # record engine's move
-            score = results.get('score', None)
-            if results["bestmove"] != "(none)":
-                game_record['moves'].append({
-                    'move': results['bestmove'],
-                    'score': score,
-                    'time': results.get('time'),
-                    'rtime': time_used,
-                    'depth': results.get('depth'),
-                    'seldepth': results.get('seldepth'),
-                    'nodes': results.get('nodes'),
-                    'nps': results.get('nps'),
-                    'hashfull': results.get('hashfull'),
-                })
-            bestmoves.append(results['bestmove'])
-
-            if self.verbosity > 1:
-                self.out.write(f"Engine {index} ({time_used} ms): {results}\n")
-
-            # check for mate (only recognize the mate admitted by the losing side)
-            if results.get('mate', 0) == -1:
-                if index == white:
-                    game_record['result'] = -1
-                    game_record['comment'] = 'Lose by mate'
-                    return LOSS, game_record
-                else:
-                    game_record['result'] = 1
-                    game_record['comment'] = 'Win by mate'
-                    return WIN, game_record
-            elif self.mate1_judge and results.get('mate', 0) == 1:
-                if index == white:
-                    game_record['result'] = 1
-                    game_record['comment'] = 'Win by mate'
-                    return WIN, game_record
-                else:
-                    game_record['result'] = -1
-                    game_record['comment'] = 'Lose by mate'
-                    return LOSS, game_record
-            elif score is not None:
-                white_score = score if index == white else -score
-                # check for end of game draw conditions
-                if white_score == 0 and 'pv' in results and len(results['pv']) == 0:
-                    if self.draw_as_black_win:
-                        game_record['result'] = -1
-                        game_record['comment'] = 'Lose by draw (draw as black win)'
-                        return LOSS, game_record
-                    else:
-                        game_record['result'] = 0
-                        game_record['comment'] = 'Draw by end of game'
-                        return DRAW, game_record
-                # check for draw adjudication
-                elif self.draw_move_limit > 0 and abs(white_score) <= self.draw_score_limit:
-                    draw_move_count += 1
-                    if draw_move_count >= self.draw_move_limit:
-                        if self.draw_as_black_win:
-                            game_record['result'] = -1
-                            game_record['comment'] = 'Lose by draw (draw as black win)'
-                            return LOSS, game_record
-                        else:
-                            game_record['result'] = 0
-                            game_record['comment'] = f'Draw by score <= {self.draw_score_limit} for ' \
-                                                     f'{self.draw_move_limit} moves'
-                            return DRAW, game_record
-                # check for win adjudication for white perspective
-                elif self.win_move_limit > 0 and white_score >= self.win_score_limit:
-                    win_move_count += 1
-                    if win_move_count >= self.win_move_limit:
-                        game_record['result'] = (1 if index == white else 0)
-                        game_record['comment'] = f'Win by score >= {self.win_score_limit} for ' \
-                                                 f'{self.win_move_limit} moves'
-                        return (WIN if index == white else LOSS), game_record
-                # check for loss adjudication for white perspective
-                elif self.win_move_limit > 0 and white_score <= -self.win_score_limit:
-                    loss_move_count += 1
-                    if loss_move_count >= self.win_move_limit:
-                        game_record['result'] = (0 if index == white else 1)
-                        game_record['comment'] = f'Loss by score <= {-self.win_score_limit} for ' \
-                                                 f'{self.win_move_limit} moves'
-                        return (LOSS if index == white else WIN), game_record
-                # refresh move counters
-                else:
-                    win_move_count = 0
-                    loss_move_count = 0
-                    draw_move_count = 0
+        repetitions = RepetitionCounter(board)
 
+        def position_rule(index, bestmove):
             # update board and judge for rule60 and repetition
-            if results['bestmove'] != "(none)":
-                board.push(chess.Move.from_uci(results['bestmove']))
-
-            # game judgement
-            if board.can_claim_fifty_moves() or board.is_repetition(3) or \
-                    board.is_insufficient_material():
-                if self.draw_as_black_win:
-                    game_record['result'] = -1
-                    game_record['comment'] = 'Lose by draw (draw as black win)'
-                    return LOSS, game_record
-                else:
-                    game_record['result'] = 0
-                    game_record['comment'] = 'Draw'
-                    return DRAW, game_record
-
-            # adjust time remaining on clock and check time loss
-            if limits['wtime'] is not None and limits['btime'] is not None:
-                if index == white:
-                    if self.nodestime > 0:
-                        limits['wtime'] += self.inc - int(results.get("time") / self.nodestime)
-                    else:
-                        limits['wtime'] += self.inc - results.get("time", time_used)
-                    if limits['wtime'] < 0:
-                        self.time_losses[index] += 1
-                        game_record['result'] = -2
-                        game_record['comment'] = 'Lose by Time loss'
-                        return LOSS, game_record
-                else:
-                    if self.nodestime > 0:
-                        limits['btime'] += self.inc - int(results.get("time") / self.nodestime)
-                    else:
-                        limits['btime'] += self.inc - results.get("time", time_used)
-                    if limits['btime'] < 0:
-                        self.time_losses[index] += 1
-                        game_record['result'] = 2
-                        game_record['comment'] = 'Win by time loss'
-                        return WIN, game_record
+            occurrences = repetitions.push(board, chess.Move.from_uci(bestmove))
+            if board.halfmove_clock >= 100 or occurrences >= 3 or board.is_insufficient_material():
+                # a mate on the hundredth halfmove or a repetition still wins
+                if board.is_checkmate():
+                    return adjudicator.win(index, 'Win by mate' if index == white else 'Lose by mate')
+                return adjudicator.draw('Draw')
+            # the material only changes on captures and pawn moves
+            if board.halfmove_clock == 0:
+                wdl = self.probe_tablebase(board)
+                if wdl is None:
+                    return None
+                elif wdl == 2:
+                    return adjudicator.loss(index, 'Lose by tablebase' if index == white else 'Win by tablebase')
+                elif wdl == -2:
+                    return adjudicator.win(index, 'Win by tablebase' if index == white else 'Lose by tablebase')
+                # cursed wins and blessed losses are drawn by the fifty move rule
+                return adjudicator.draw('Draw by tablebase', 'tablebase')
+            return None
+
+        return position_rule
 
     def do_init_engine(self, engine_path, engine_options):
         import chess.uci
-        engine = chess.uci.popen_engine(engine_path)
+        engine = chess.uci.reactor_spawn_engine(engine_path)
+        engine.latency = latency.LatencyStats()
         engine.uci(async_callback=False)
+        engine.option_change_handlers.append(self.on_option_changed)
         engine.setoption(engine_options, async_callback=False)
         engine.info_handlers.append(chess.uci.InfoHandler())
+        engine.lazy_info = True  # only the final info lines are read
+        engine.use_string_moves("chess")
+        engine.pipelined = True  # ucinewgame, setoption and position are written with go
         return engine
 
     def do_check_engine(self, engine) -> bool:
@@ -210,7 +166,9 @@ class ChessEngineMatch(EngineMatch):
         engine.quit(async_callback=False)
 
     def do_init_game(self, engine, pos, limits):
+        import chess.uci
         engine.ucinewgame()
+        engine.position_builder = chess.uci.PositionBuilder(pos if pos.startswith("fen ") else "fen " + pos)
 
     def get_offset_from_pos(self, pos):
         parts = pos.split(' ')
@@ -219,18 +177,20 @@ class ChessEngineMatch(EngineMatch):
         return 0
 
     def do_play_game(self, engine, pos, bestmoves, limits):
-        fen = pos if pos.startswith("fen ") else "fen " + pos
-        engine.send_line("position " + fen + " moves " + " ".join(bestmoves))
+        engine.position(engine.position_builder.update(bestmoves))
         if engine.chess_db:
             engine.chess_db_pos = pos + " moves " + " ".join(bestmoves)
 
-        bestmove, ponder = engine.go(depth=limits['depth'],
-                                     nodes=limits['nodes'],
-                                     movetime=limits['movetime'],
-                                     wtime=limits['wtime'],
-                                     btime=limits['btime'],
-                                     winc=limits['winc'],
-                                     binc=limits['binc'])
+        with self.watch_move(engine, limits) as deadline:
+            bestmove, ponder = engine.go(depth=limits['depth'],
+                                         nodes=limits['nodes'],
+                                         movetime=limits['movetime'],
+                                         wtime=limits['wtime'],
+                                         btime=limits['btime'],
+                                         winc=limits['winc'],
+                                         binc=limits['binc'])
+        if deadline.expired:
+            return self.deadline_timeout(bestmoves)
 
         with engine.info_handlers[0] as info:
             if 'string' in info:
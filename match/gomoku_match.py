@@ -1,5 +1,7 @@
 import re
+import gomoku.board
 import gomoku.piskpipe as piskpipe
+import util.latency as latency
 from match.base_match import EngineMatch
 
 RESULTS = [WIN, LOSS, DRAW] = range(3)
@@ -8,6 +10,10 @@ SCORES = [1, 0, 0.5]
 
 class GomokuEngineMatch(EngineMatch):
     """Compare two piskvork engines by running an engine match."""
+    # any mate admitted by the losing side ends the game, moves are recorded compactly
+    admit_any_mate = True
+    compact_moves = True
+
     def __init__(self,
                  rule,
                  board_size,
@@ -26,16 +32,37 @@ class GomokuEngineMatch(EngineMatch):
                  draw_score_limit=-1,
                  win_move_limit=-1,
                  win_score_limit=-1,
-                 verbosity=0):
+                 verbosity=0,
+                 joint_adjudication=None):
         assert rule in ["freestyle", "standard", "renju"]
         super().__init__(f"{rule}{board_size}", engine1, engine2, e1_options, e2_options, time,
                          inctime, depth, nodes, movetime, nodestime, draw_after, draw_move_limit,
-                         draw_score_limit, win_move_limit, win_score_limit, verbosity)
+                         draw_score_limit, win_move_limit, win_score_limit, verbosity,
+                         joint_adjudication=joint_adjudication)
         self.rule = 0 if rule == "freestyle" else 1 if rule == "standard" else 4
         self.board_size = board_size
 
+    def make_position_rule(self, adjudicator, white, black, pos):
+        board = gomoku.board.Board(self.board_size, self.rule, pos)
+
+        def position_rule(index, bestmove):
+            # judge the stone by the rules, engines may not report a mate score for a five
+            if not board.is_legal(bestmove):
+                return adjudicator.loss(index, 'Lose by illegal move' if index == white else 'Win by illegal move')
+            result = board.push(bestmove)
+            if result == gomoku.board.FIVE:
+                return adjudicator.win(index, 'Win by five' if index == white else 'Lose by five')
+            elif result == gomoku.board.FORBIDDEN:
+                return adjudicator.loss(index, 'Lose by forbidden move' if index == white else 'Win by forbidden move')
+            elif result == gomoku.board.FULL:
+                return adjudicator.draw('Draw by full board')
+            return None
+
+        return position_rule
+
     def do_init_engine(self, engine_path, engine_options):
         engine = piskpipe.popen_engine(engine_path)
+        engine.latency = latency.LatencyStats()
         options = {"rule": self.rule, "show_detail": 2, "max_memory": 350 * 1024 * 1024}
         options.update(engine_options)
         if self.verbosity > 1:
@@ -82,28 +109,16 @@ class GomokuEngineMatch(EngineMatch):
         engine.clear_messages()
         color = 'w' if (self.get_offset_from_pos(pos) + len(bestmoves)) % 2 == 0 else 'b'
 
-        # Set the deadline to the time limit plus a tolerance.
-        tolerance = 5.0
-        if limits['movetime']:
-            deadline_time = limits['movetime'] * 0.001 + tolerance
-        elif limits[f'{color}time']:
+        if not limits['movetime'] and limits[f'{color}time']:
             engine.info({'time_left': limits[f'{color}time']}, async_callback=False)
-            deadline_time = (limits[f'{color}time'] + limits[f'{color}inc']) * 0.001 + tolerance
-        else:
-            deadline_time = None
 
-        try:
+        with self.watch_move(engine, limits) as deadline:
             if len(bestmoves) < 2:
-                bestmove = engine.board(pos + "".join(bestmoves),
-                                        start_thinking=True,
-                                        async_callback=deadline_time)
+                bestmove = engine.board(pos + "".join(bestmoves), start_thinking=True)
             else:
-                bestmove = engine.turn(bestmoves[-1], async_callback=deadline_time)
-        except piskpipe.TimeoutError as e:
-            engine.kill()
-            if self.verbosity > 0:
-                self.out.write(f"Force killed timeout engine. Moves: " + " ".join(bestmoves) + '\n')
-            return 'timeout'
+                bestmove = engine.turn(bestmoves[-1])
+        if deadline.expired:
+            return self.deadline_timeout(bestmoves)
 
         for pvinfo in reversed(engine.infos):
             if pvinfo["pvidx"] == 0:
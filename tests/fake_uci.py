@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""A UCI engine for the tests, shuffling its knights back and forth."""
+import sys
+
+MOVES = {
+    "chess": ["g1f3", "g8f6", "f3g1", "f6g8"],
+    "xiangqi": ["h0g2", "h9g7", "g2h0", "g7h9"],
+}
+
+variant = "chess"
+ply = 0
+for line in sys.stdin:
+    tokens = line.split()
+    if not tokens:
+        continue
+    elif tokens[0] == "uci":
+        print("id name Fake\noption name Hash type spin default 16 min 1 max 1024\nuciok", flush=True)
+    elif tokens[0] == "isready":
+        print("readyok", flush=True)
+    elif tokens[:4] == ["setoption", "name", "UCI_Variant", "value"]:
+        variant = tokens[4]
+    elif tokens[0] == "position":
+        ply = len(tokens) - tokens.index("moves") - 1 if "moves" in tokens else 0
+    elif tokens[0] == "go":
+        # never answers a search of depth 99
+        if "depth" in tokens and tokens[tokens.index("depth") + 1] == "99":
+            continue
+        move = MOVES[variant][ply % 4]
+        print(f"info depth 1 score cp 0 time 1 pv {move}", flush=True)
+        print(f"bestmove {move}", flush=True)
+    elif tokens[0] == "quit":
+        break
@@ -0,0 +1,59 @@
+import os
+import unittest
+
+import fishtest
+import match.base_match as base_match
+from match.async_match import AsyncMatchRunner
+from match.chess_match import ChessEngineMatch
+from match.xiangqi_match import XiangQiEngineMatch
+
+ENGINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_uci.py")
+CHESS_START = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+XIANGQI_START = "rnbakabnr/9/1c5c1/p1p1p1p1p/9/9/P1P1P1P1P/1C5C1/9/RNBAKABNR w"
+
+
+class AsyncMatchRunnerTest(unittest.TestCase):
+    def test_chess_games_end_by_the_driver_rules(self):
+        match = ChessEngineMatch(ENGINE, ENGINE, {"Hash": 32}, {}, time=10000, inctime=100)
+        outcomes = AsyncMatchRunner(match).run_games([(0, 1, CHESS_START), (1, 0, CHESS_START)] * 5, concurrency=4)
+        for outcome, game_record in outcomes:
+            self.assertEqual(outcome, "draw")
+            self.assertEqual(len(game_record["bestmoves"]), 8)
+        self.assertEqual(match.scores, [0, 0, 10])
+
+    def test_xiangqi_game_sends_the_variant(self):
+        match = XiangQiEngineMatch(ENGINE, ENGINE, {}, {}, time=10000, inctime=100)
+        outcome, game_record = AsyncMatchRunner(match).run_game(0, 1, XIANGQI_START)
+        self.assertEqual(outcome, "draw")
+        self.assertEqual(game_record["comment"], "Draw by repetition")
+        self.assertEqual(game_record["bestmoves"][:4], ["h0g2", "h9g7", "g2h0", "g7h9"])
+
+    def test_hung_engine_loses_by_deadline(self):
+        tolerance = base_match.DEADLINE_TOLERANCE
+        base_match.DEADLINE_TOLERANCE = 0.2
+        try:
+            match = ChessEngineMatch(ENGINE, ENGINE, {}, {}, time=100, inctime=0, depth=99)
+            outcome, game_record = AsyncMatchRunner(match).run_game(0, 1, CHESS_START)
+        finally:
+            base_match.DEADLINE_TOLERANCE = tolerance
+        self.assertEqual(outcome, "lose")
+        self.assertEqual(game_record["comment"], "Lose by deadline timeout")
+        self.assertEqual(match.time_losses, [1, 0])
+
+    def test_tester_plays_on_the_runner_behind_the_flag(self):
+        ops = {"depth": None, "nodes": None, "game_time": 10000, "inc_time": 100, "move_time": None, "hash": 16,
+               "draw_move_limit": -1, "draw_score_limit": -1, "win_move_limit": -1, "win_score_limit": -1,
+               "uci_ops": None, "baseline_uci_ops": None, "draw_as_black_win": False, "mate1_judge": False,
+               "nodestime": 0}
+        tester = fishtest.Tester.__new__(fishtest.Tester)
+        fishtest.ASYNC_MATCH = True
+        try:
+            outcome, game_record = tester.process_match("chess", 1, CHESS_START, ENGINE, ENGINE, "", "", ops)
+        finally:
+            fishtest.ASYNC_MATCH = False
+        self.assertEqual(outcome, "draw")
+        self.assertEqual(game_record["order"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,38 @@
+import sys
+import unittest
+
+from match.chess_match import ChessEngineMatch
+
+
+def scripted_match(moves):
+    """A ChessEngineMatch whose engines play *moves* without reporting a mate."""
+    match = ChessEngineMatch(sys.executable, sys.executable, {}, {}, time=1000, inctime=0)
+    match.engines = [None, None]
+    match.time_losses = [0, 0]
+    match.do_init_game = lambda engine, pos, limits: None
+    match.do_play_game = lambda engine, pos, bestmoves, limits: {
+        "bestmove": moves[len(bestmoves)], "score": 10, "mate": 0, "pv": [moves[len(bestmoves)]], "time": 5}
+    return match
+
+
+class ChessEngineMatchTest(unittest.TestCase):
+    def test_mate_on_hundredth_halfmove_wins(self):
+        match = scripted_match(["a1a8"])
+        res, game_record = match._play_one_game(0, 1, "7k/8/6K1/8/8/8/8/R7 w - - 99 80")
+        self.assertEqual(game_record["result"], 1)
+        self.assertEqual(game_record["comment"], "Win by mate")
+
+    def test_quiet_hundredth_halfmove_draws(self):
+        match = scripted_match(["a1a7"])
+        res, game_record = match._play_one_game(0, 1, "7k/8/6K1/8/8/8/8/R7 w - - 99 80")
+        self.assertEqual(game_record["result"], 0)
+
+    def test_threefold_repetition_draws(self):
+        match = scripted_match("g1f3 g8f6 f3g1 f6g8 g1f3 g8f6 f3g1 f6g8".split())
+        res, game_record = match._play_one_game(0, 1, "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1")
+        self.assertEqual(game_record["result"], 0)
+        self.assertEqual(len(game_record["bestmoves"]), 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import hashlib
+import json
+import lzma
+import os
+import shutil
+import threading
+import time
+import zipfile
+
+# Decompressed artifacts live on tmpfs when available so that every engine
+# reading the same weight shares one page-cache copy.
+CACHE_DIR = "/dev/shm/fishtest" if os.path.isdir("/dev/shm") else "./files/cache"
+COMPRESSED_EXT = ".xz"
+META_EXT = ".meta.json"
+CHUNK_SIZE = 1024 * 1024
+# Bytes of CACHE_DIR kept, the least recently used artifacts beyond are evicted
+# once they were idle for CACHE_MIN_IDLE seconds, as engines may still load them.
+CACHE_MAX_BYTES = 2 * 1024 ** 3
+CACHE_MIN_IDLE = 300
+
+_lock = threading.Lock()
+_materialized = {}
+_extracted = {}
+_last_used = {}
+
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def is_compressed(path):
+    return os.path.isfile(path + COMPRESSED_EXT)
+
+
+def read_meta(path):
+    meta_path = path + META_EXT
+    if not os.path.isfile(meta_path):
+        return {}
+    try:
+        with open(meta_path, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def compress(path, preset=6):
+    """
+    Store a downloaded weight compressed with its digest metadata.
+    Zip archives (gomoku weights) are already compressed and left as is.
+    Returns the path of the stored artifact.
+    """
+    if not os.path.isfile(path) or zipfile.is_zipfile(path):
+        return path
+    digest = file_digest(path)
+    size = os.path.getsize(path)
+    tmp_path = path + COMPRESSED_EXT + ".tmp"
+    with open(path, "rb") as fin, lzma.open(tmp_path, "wb", preset=preset) as fout:
+        shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+    os.replace(tmp_path, path + COMPRESSED_EXT)
+    with open(path + META_EXT, "w") as f:
+        json.dump({
+            "name": os.path.basename(path),
+            "format": "xz",
+            "sha256": digest,
+            "size": size,
+            "compressed_size": os.path.getsize(path + COMPRESSED_EXT),
+        }, f)
+    os.remove(path)
+    return path + COMPRESSED_EXT
+
+
+def clean_cache():
+    """Remove the artifacts left in CACHE_DIR by earlier runs, called on start."""
+    with _lock:
+        shutil.rmtree(CACHE_DIR, ignore_errors=True)
+        _materialized.clear()
+        _extracted.clear()
+        _last_used.clear()
+
+
+def _dir_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for file in files:
+            try:
+                size += os.path.getsize(os.path.join(root, file))
+            except OSError:
+                pass
+    return size
+
+
+def _use(entry_dir):
+    """
+    Mark a CACHE_DIR entry as used and evict the least recently used
+    entries while the cache is over CACHE_MAX_BYTES. Called with _lock held.
+    """
+    now = time.time()
+    _last_used[entry_dir] = now
+    sizes = {d: _dir_size(d) for d in _last_used}
+    total = sum(sizes.values())
+    for d in sorted(_last_used, key=_last_used.get):
+        if total <= CACHE_MAX_BYTES or now - _last_used[d] < CACHE_MIN_IDLE:
+            break
+        shutil.rmtree(d, ignore_errors=True)
+        total -= sizes[d]
+        del _last_used[d]
+
+
+def materialize(path):
+    """
+    Return a readable path for an artifact.
+    Compressed artifacts are decompressed once into CACHE_DIR, keyed by digest,
+    and the same copy is handed out to every later caller until it is evicted.
+    """
+    if not path or os.path.isfile(path) or not is_compressed(path):
+        return path
+    with _lock:
+        cached = _materialized.get(path)
+        if cached and os.path.isfile(cached):
+            _use(os.path.dirname(cached))
+            return cached
+        meta = read_meta(path)
+        digest = meta.get("sha256") or file_digest(path + COMPRESSED_EXT)
+        target_dir = os.path.join(CACHE_DIR, digest[:16])
+        target = os.path.join(target_dir, os.path.basename(path))
+        if not os.path.isfile(target):
+            os.makedirs(target_dir, exist_ok=True)
+            tmp_path = f"{target}.{os.getpid()}.tmp"
+            with lzma.open(path + COMPRESSED_EXT, "rb") as fin, open(tmp_path, "wb") as fout:
+                shutil.copyfileobj(fin, fout, CHUNK_SIZE)
+            if meta and file_digest(tmp_path) != meta["sha256"]:
+                os.remove(tmp_path)
+                raise Exception(f"Artifact digest mismatch: {path}")
+            os.replace(tmp_path, target)
+        _materialized[path] = target
+        _use(target_dir)
+        return target
+
+
+def extract_zip(path):
+    """
+    Extract a zipped weight once into CACHE_DIR and return the directory.
+    The directory is named by digest, so links into it stay valid when it is
+    extracted again after an eviction.
+    """
+    with _lock:
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        target_dir = _extracted.get(key)
+        if target_dir and os.path.isfile(os.path.join(target_dir, ".ready")):
+            _use(target_dir)
+            return target_dir
+        name = os.path.splitext(os.path.basename(path))[0]
+        target_dir = os.path.abspath(os.path.join(CACHE_DIR, f"{name}-{file_digest(path)[:16]}"))
+        ready_path = os.path.join(target_dir, ".ready")
+        if not os.path.isfile(ready_path):
+            os.makedirs(target_dir, exist_ok=True)
+            with zipfile.ZipFile(path, "r") as f:
+                f.extractall(target_dir)
+            open(ready_path, "a").close()
+        _extracted[key] = target_dir
+        _use(target_dir)
+        return target_dir
+
+
+def link_tree(src_dir, dst_dir):
+    """Populate dst_dir with links to the files of src_dir, copying where links are unsupported."""
+    for root, dirs, files in os.walk(src_dir):
+        rel = os.path.relpath(root, src_dir)
+        os.makedirs(os.path.join(dst_dir, rel), exist_ok=True)
+        for file in files:
+            if file == ".ready":
+                continue
+            src = os.path.join(root, file)
+            dst = os.path.join(dst_dir, rel, file)
+            if os.path.lexists(dst):
+                os.remove(dst)
+            try:
+                os.symlink(src, dst)
+            except (OSError, NotImplementedError):
+                shutil.copyfile(src, dst)
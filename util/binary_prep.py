@@ -0,0 +1,127 @@
+import os
+import random
+import stat
+import subprocess
+import threading
+import time
+
+UPX_PATH = "./upx"
+UPX_SUFFIX = "_upx"
+BENCH_RUNS = 3
+BENCH_TIMEOUT = 10
+
+PREPARED = "prepared"
+COMPRESSING = "compressing"
+FAILED = "failed"
+
+_lock = threading.Lock()
+_bench_lock = threading.Lock()
+_states = {}
+_choices = {}
+
+
+def make_executable(path):
+    """Set the executable bits on a file without forking a shell."""
+    if os.name == 'nt' or not path or os.access(path, os.X_OK):
+        return
+    mode = os.stat(path).st_mode
+    os.chmod(path, mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+
+
+def _compress(path, log):
+    tmp_path = path + UPX_SUFFIX + ".tmp"
+    try:
+        make_executable(UPX_PATH)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        subprocess.run([UPX_PATH, f"-{random.randint(1, 9)}", "-o", tmp_path, path],
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        make_executable(tmp_path)
+        os.replace(tmp_path, path + UPX_SUFFIX)
+        state = PREPARED
+    except Exception as e:
+        if log is not None:
+            log(f"UPX failed for {path}: {repr(e)}")
+        state = FAILED
+    with _lock:
+        _states[path] = state
+
+
+def prepare(path, upx=True, log=None):
+    """
+    Prepare an engine binary once: make it executable and, optionally, build
+    a UPX compressed copy in a background thread. The uncompressed binary
+    can be used while compression is still running. Failures are reported
+    through *log*, like the caller's print, if given.
+    :return: the preparation state of the binary
+    """
+    with _lock:
+        if path in _states:
+            return _states[path]
+        make_executable(path)
+        if upx and os.name != 'nt' and os.path.exists(UPX_PATH) and not os.path.exists(path + UPX_SUFFIX):
+            _states[path] = COMPRESSING
+            thread = threading.Thread(target=_compress, args=(path, log))
+            thread.daemon = True
+            thread.start()
+        else:
+            _states[path] = PREPARED
+        return _states[path]
+
+
+def spawn_latency(path, runs=BENCH_RUNS):
+    """
+    Measure the startup cost of a binary as the best of several runs from
+    spawn to exit with a closed stdin. Returns seconds, or None on failure.
+    """
+    best = None
+    for _ in range(runs):
+        start = time.perf_counter()
+        try:
+            subprocess.run([os.path.abspath(path)], stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                           stderr=subprocess.DEVNULL, timeout=BENCH_TIMEOUT)
+        except (OSError, subprocess.SubprocessError):
+            return None
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def select(path, log=None):
+    """
+    Return the binary to launch for an engine: the UPX compressed copy if it
+    exists and starts at least as fast as the original, else the original.
+    The choice is benchmarked once per binary and then cached, the measured
+    latencies are reported through *log* if given.
+    """
+    with _lock:
+        if path in _choices:
+            return _choices[path]
+        if _states.get(path) == COMPRESSING:
+            return path
+    upx_path = path + UPX_SUFFIX
+    if not os.path.exists(upx_path):
+        make_executable(path)
+        return path
+    with _bench_lock:
+        with _lock:
+            if path in _choices:
+                return _choices[path]
+        make_executable(path)
+        make_executable(upx_path)
+        upx_latency = spawn_latency(upx_path)
+        plain_latency = spawn_latency(path)
+        if upx_latency is None:
+            choice = path
+        elif plain_latency is None or upx_latency <= plain_latency:
+            choice = upx_path
+        else:
+            choice = path
+        if log is not None:
+            log(f"Spawn latency {os.path.basename(path)}: {plain_latency}, "
+                f"{os.path.basename(upx_path)}: {upx_latency}, using {os.path.basename(choice)}")
+        with _lock:
+            _choices[path] = choice
+            _states[path] = PREPARED
+        return choice
@@ -1,23 +1,166 @@
-import random
+import os
+import json
 import time
+import threading
 import multiprocessing as mp
 import requests
 import base64
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+import util.record_codec as record_codec
 
 magic = "aCp0KnRwOi8vdGVzdC5waWthZmlzaC5vcmcvYSpwKmk="
 magic = base64.b64decode(magic).decode().replace("*", "")
-sess = requests.Session()
+
+POOL_SIZE = 4
+
+MIRROR_STATS_PATH = "./files/mirror_stats.json"
+EWMA_ALPHA = 0.3
+HEALTHY_ERROR_RATE = 0.5
+HEDGE_STALL_TIME = 10  # seconds without progress before a second mirror is tried
+DOWNLOAD_TIMEOUT = 60
+CHUNK_SIZE = 64 * 1024
+MIN_DOWNLOAD_SIZE = 1024 * 100  # engines and weights are larger, smaller payloads are quota or error pages
+LONG_POLL_WAIT = 25  # seconds the server may hold a poll request, also serves as heartbeat interval
+LONG_POLL_UNSUPPORTED = "unsupported"
+
+
+class Channel:
+    """
+    A request queue with its own keep-alive connection pool, served by a fixed
+    number of worker threads. Every endpoint gets its own channel, so a slow
+    upload never delays a heartbeat or a task fetch.
+    """
+    def __init__(self, name, timeout, deadline, workers=1, pool_size=POOL_SIZE):
+        self.name = name
+        self.timeout = timeout  # (connect, read) timeout of a single socket operation
+        self.deadline = deadline  # total time of a request on its worker, None for streamed downloads
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"net-{name}")
+
+    def _send(self, method, url, **kwargs):
+        """
+        Run a request on a worker. With a deadline the response is read in
+        chunks and the request is aborted once it took longer, so a slow
+        server cannot hold the worker of the channel.
+        """
+        if self.deadline is None:
+            return self.session.request(method, url, **kwargs)
+        end = time.monotonic() + self.deadline
+        connect_timeout, read_timeout = kwargs.pop("timeout")
+        rep = self.session.request(method, url, stream=True,
+                                   timeout=(connect_timeout, min(read_timeout, self.deadline)), **kwargs)
+        with rep:
+            content = []
+            # read1 of urllib3 2 returns the bytes as they arrive instead of waiting for a full chunk
+            read = getattr(rep.raw, "read1", rep.raw.read)
+            for chunk in iter(lambda: read(CHUNK_SIZE, decode_content=True), b""):
+                if time.monotonic() > end:
+                    raise TimeoutError(f"{self.name} request took longer than {self.deadline}s: {url}")
+                content.append(chunk)
+            rep._content = b"".join(content)
+        return rep
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return self.executor.submit(self._send, method, url, **kwargs).result()
+
+    def get(self, url, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+
+heartbeat_channel = Channel("heartbeat", timeout=(5, 10), deadline=20)
+task_channel = Channel("tasks", timeout=(5, 30), deadline=60)
+upload_channel = Channel("upload", timeout=(10, 120), deadline=300)
+poll_channel = Channel("poll", timeout=(5, LONG_POLL_WAIT + 15), deadline=LONG_POLL_WAIT + 30)
+download_channel = Channel("download", timeout=(10, DOWNLOAD_TIMEOUT), deadline=None, workers=2)
+
+
+class MirrorStats:
+    """Per-mirror EWMA of download throughput and error rate, persisted across restarts."""
+    def __init__(self, path=MIRROR_STATS_PATH):
+        self.path = path
+        self.lock = threading.Lock()
+        self.stats = {}
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, "r") as f:
+                self.stats = json.load(f)
+        except (OSError, ValueError):
+            self.stats = {}
+
+    def save(self):
+        try:
+            with self.lock:
+                data = json.dumps(self.stats)
+            with open(self.path + ".tmp", "w") as f:
+                f.write(data)
+            os.replace(self.path + ".tmp", self.path)
+        except OSError as e:
+            print("保存镜像统计失败:", repr(e))
+
+    def record(self, mirror, nbytes, seconds, ok):
+        with self.lock:
+            stat = self.stats.setdefault(mirror, {"throughput": None, "error_rate": 0.0, "samples": 0})
+            stat["samples"] += 1
+            stat["error_rate"] += EWMA_ALPHA * ((0.0 if ok else 1.0) - stat["error_rate"])
+            # failed downloads say nothing about the throughput of the mirror
+            if ok and seconds > 0:
+                throughput = nbytes / seconds
+                if stat["throughput"] is None:
+                    stat["throughput"] = throughput
+                else:
+                    stat["throughput"] += EWMA_ALPHA * (throughput - stat["throughput"])
+
+    def score(self, mirror):
+        stat = self.stats.get(mirror)
+        if stat is None:
+            return float("inf")  # unknown mirrors are tried first so that they get measured
+        # a mirror that only failed so far has no throughput
+        score = (stat["throughput"] or 0.0) * (1.0 - stat["error_rate"])
+        if stat["error_rate"] >= HEALTHY_ERROR_RATE:
+            score -= 1e12  # unhealthy mirrors go after all healthy ones
+        return score
+
+    def rank(self, mirrors):
+        with self.lock:
+            return sorted(mirrors, key=self.score, reverse=True)
+
+
+mirror_stats = MirrorStats()
+
+# Upload formats announced by the server, empty until it says otherwise.
+server_capabilities = {"upload_encodings": [], "record_formats": []}
+
+
+def update_capabilities(data):
+    for key in server_capabilities:
+        if isinstance(data, dict) and key in data:
+            server_capabilities[key] = list(data[key] or [])
 
 
 def heartbeat(client_id, processing_task_ids):
     try:
-        rep = sess.post(magic + "/heartbeat", json={
+        rep = heartbeat_channel.post(magic + "/heartbeat", json={
             "client_id": client_id,
             "core_count": mp.cpu_count(),
-            "task_ids": processing_task_ids
+            "task_ids": processing_task_ids,
+            "upload_encodings": record_codec.supported_encodings(),
+            "record_formats": [record_codec.COLUMNAR, record_codec.VERBOSE]
         })
         if rep.status_code == 200:
-            return rep.json()
+            data = rep.json()
+            update_capabilities(data)
+            return data
         else:
             return None
     except Exception as e:
@@ -25,11 +168,49 @@ def heartbeat(client_id, processing_task_ids):
         return None
 
 
+def poll_events(client_id, processing_task_ids, want_tasks, wait=LONG_POLL_WAIT):
+    """
+    Long-poll the server. The request is held open until the server has
+    tasks (if wanted), task invalidations or a version notice for us, or
+    until *wait* seconds have passed. It also counts as a heartbeat.
+    :return: the event dict, None on failure, or LONG_POLL_UNSUPPORTED if the
+        server does not offer long polling.
+    """
+    try:
+        rep = poll_channel.post(magic + "/poll", json={
+            "client_id": client_id,
+            "core_count": mp.cpu_count(),
+            "task_ids": processing_task_ids,
+            "want_tasks": want_tasks,
+            "wait": wait,
+            "upload_encodings": record_codec.supported_encodings(),
+            "record_formats": [record_codec.COLUMNAR, record_codec.VERBOSE]
+        })
+        if rep.status_code == 200:
+            try:
+                data = rep.json()
+            except ValueError:
+                print("长轮询返回的不是 JSON:", rep.text[:200])
+                return None
+            update_capabilities(data)
+            return data
+        elif rep.status_code in (404, 405, 501):
+            return LONG_POLL_UNSUPPORTED
+        else:
+            print("长轮询失败: HTTP", rep.status_code)
+            return None
+    except Exception as e:
+        print("长轮询失败:", repr(e))
+        return None
+
+
 def get_tasks(client_id):
     try:
-        rep = sess.get(magic + "/get_tasks?password=ftclient!&client_id=" + client_id + "&core_count=" + str(mp.cpu_count()))
+        rep = task_channel.get(magic + "/get_tasks?password=ftclient!&client_id=" + client_id + "&core_count=" + str(mp.cpu_count()))
         if rep.status_code == 200:
-            return rep.json()
+            data = rep.json()
+            update_capabilities(data)
+            return data
         else:
             return None
     except Exception as e:
@@ -39,7 +220,7 @@ def get_tasks(client_id):
 
 def register_task(client_id, task_id):
     try:
-        rep = sess.post(magic + f"/register_task", json={
+        rep = task_channel.post(magic + f"/register_task", json={
             "task_id": task_id,
             "client_id": client_id,
             "core_count": mp.cpu_count()
@@ -55,12 +236,25 @@ def register_task(client_id, task_id):
 
 def upload_result(client_id, task_id, program_version, wdl, fwdl, ptnml, game_records,
                   task_type="normal", current_iter=None, vars1=None, vars2=None):
+    """:return: the reply of the server, None if the upload failed and should be retried"""
+    payload = {"client_id": client_id, "task_id": task_id, "type": task_type,
+               "program_version": program_version,
+               "wdl": wdl, "fwdl": fwdl, "ptnml": ptnml,
+               "game_records": game_records, "iter": current_iter,
+               "vars1": vars1, "vars2": vars2}
     try:
-        rep = sess.post(magic + "/upload_result", json={"client_id": client_id, "task_id": task_id, "type": task_type,
-                                                            "program_version": program_version,
-                                                            "wdl": wdl, "fwdl": fwdl, "ptnml": ptnml,
-                                                            "game_records": game_records, "iter": current_iter,
-                                                            "vars1": vars1, "vars2": vars2})
+        body, headers = record_codec.encode_payload(payload, server_capabilities["upload_encodings"],
+                                                    server_capabilities["record_formats"])
+        rep = upload_channel.post(magic + "/upload_result", data=body, headers=headers)
+        if rep.status_code in (400, 415) and ("Content-Encoding" in headers or "X-Record-Format" in headers):
+            # The server rejected the compact upload, fall back to verbose JSON from now on
+            print("服务器不支持压缩上传，改用 JSON")
+            server_capabilities["upload_encodings"] = []
+            server_capabilities["record_formats"] = []
+            rep = upload_channel.post(magic + "/upload_result", json=payload)
+        if rep.status_code >= 500:
+            print("上传结果失败: HTTP", rep.status_code)
+            return None
         info = rep.text
         return info
     except Exception as e:
@@ -68,17 +262,24 @@ def upload_result(client_id, task_id, program_version, wdl, fwdl, ptnml, game_re
         return None
 
 
-def download_file(url, save_path):
+def download_file(url, save_path, progress=None, cancel=None):
     try:
-        req = sess.get(url)
-        data = req.content
-        if len(data) < 1024 * 10:
-            text = data.decode(encoding="utf-8", errors="ignore")
+        size = 0
+        with download_channel.get(url, stream=True) as req, open(save_path, "wb") as f:
+            req.raise_for_status()
+            for chunk in req.iter_content(CHUNK_SIZE):
+                if cancel is not None and cancel.is_set():
+                    return False
+                f.write(chunk)
+                size += len(chunk)
+                if progress is not None:
+                    progress(len(chunk))
+        if size < 1024 * 10:
+            with open(save_path, "rb") as f:
+                text = f.read().decode(encoding="utf-8", errors="ignore")
             if "download-form" in text:
                 confirm_url = text.split('download-form" action="')[1].split('"')[0].replace("&amp;", "&")
                 return download_file_with_post(confirm_url, save_path)
-        with open(save_path, "wb") as f:
-            f.write(data)
         return True
     except Exception as e:
         print("下载文件失败:", repr(e))
@@ -87,7 +288,8 @@ def download_file(url, save_path):
 
 def download_file_with_post(url, save_path):
     try:
-        req = sess.post(url)
+        req = download_channel.post(url)
+        req.raise_for_status()
         data = req.content
         with open(save_path, "wb") as f:
             f.write(data)
@@ -97,14 +299,80 @@ def download_file_with_post(url, save_path):
         return False
 
 
+class _DownloadAttempt:
+    def __init__(self, mirror, url, part_path, finished):
+        self.mirror = mirror
+        self.part_path = part_path
+        self.start_time = time.time()
+        self.progress_time = self.start_time
+        self.bytes = 0
+        self.ok = False
+        self.done = False
+        self.cancel = threading.Event()
+        self.finished = finished
+        self.thread = threading.Thread(target=self._run, args=(url,))
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _progress(self, nbytes):
+        self.bytes += nbytes
+        self.progress_time = time.time()
+
+    def _run(self, url):
+        ok = download_file(self.mirror + url, self.part_path, self._progress, self.cancel)
+        if ok and os.path.getsize(self.part_path) < MIN_DOWNLOAD_SIZE:
+            print(f"镜像 {self.mirror} 返回的文件过小，可能是网盘超限")
+            ok = False
+        self.ok = ok
+        if self.cancel.is_set() and os.path.exists(self.part_path):
+            os.remove(self.part_path)
+        self.done = True
+        self.finished.set()
+
+    def stalled(self):
+        return not self.done and time.time() - self.progress_time > HEDGE_STALL_TIME
+
+
+def _hedged_download(url, save_path, primary, backup):
+    """Download from primary and start a hedged request to backup if primary stalls."""
+    finished = threading.Event()
+    attempts = [_DownloadAttempt(primary, url, save_path + ".0.part", finished)]
+    winner = None
+    while winner is None:
+        finished.wait(0.5)
+        finished.clear()
+        for attempt in attempts:
+            if attempt.done and attempt.ok:
+                winner = attempt
+                break
+        if winner is None and all(attempt.done for attempt in attempts):
+            break
+        if winner is None and backup is not None and len(attempts) == 1 and attempts[0].stalled():
+            print(f"下载停滞，同时尝试镜像 {backup}")
+            attempts.append(_DownloadAttempt(backup, url, save_path + ".1.part", finished))
+
+    for attempt in attempts:
+        elapsed = time.time() - attempt.start_time
+        ok = attempt.ok if attempt.done else not attempt.stalled()
+        mirror_stats.record(attempt.mirror, attempt.bytes, elapsed, ok)
+        if attempt is winner:
+            os.replace(attempt.part_path, save_path)
+        else:
+            attempt.cancel.set()
+            if attempt.done and os.path.exists(attempt.part_path):
+                os.remove(attempt.part_path)
+    mirror_stats.save()
+    return winner is not None
+
+
 def download_file_with_trail(url, save_path, webdrives, retry_count=3):
-    drive_index = random.randint(0, len(webdrives) - 1)
+    drives = mirror_stats.rank(webdrives)
     for i in range(retry_count):
-        drive = webdrives[drive_index]
-        if download_file(drive + url, save_path):
+        primary = drives[i % len(drives)]
+        backup = drives[(i + 1) % len(drives)] if len(drives) > 1 else None
+        if _hedged_download(url, save_path, primary, backup):
             return True
         print("下载失败，重试中")
-        drive_index = (drive_index + 1) % len(webdrives)
         time.sleep(1)
     return False
 
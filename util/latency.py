@@ -0,0 +1,93 @@
+import threading
+
+# Timestamps taken for every engine command, in order. Each histogram covers
+# the interval from the previous stage that was reached to this one:
+#   write         queue handoff until the command line is written
+#   first_output  engine start-up until its first line after the write
+#   bestmove      search time until the bestmove line arrives
+#   result        bestmove handling (info parsing) until the result is set
+STAGES = ("enqueue", "write", "first_output", "bestmove", "result")
+TOTAL = "total"
+
+
+class Histogram:
+    """A histogram of nanosecond durations with power of two buckets."""
+    def __init__(self):
+        self.buckets = [0] * 64
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, ns):
+        ns = max(ns, 0)
+        self.buckets[min(ns.bit_length(), 63)] += 1
+        self.count += 1
+        self.total += ns
+        if self.min is None or ns < self.min:
+            self.min = ns
+        if self.max is None or ns > self.max:
+            self.max = ns
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the q-th percentile."""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if n and seen >= rank:
+                return min(1 << i, self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean_us": self.total / self.count / 1000 if self.count else None,
+            "min_us": self.min / 1000 if self.min is not None else None,
+            "p50_us": self.percentile(50) / 1000 if self.count else None,
+            "p99_us": self.percentile(99) / 1000 if self.count else None,
+            "max_us": self.max / 1000 if self.max is not None else None,
+        }
+
+
+class LatencyStats:
+    """Per engine latency histograms, keyed by command name and stage."""
+    def __init__(self):
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def record(self, name, timestamps):
+        """Add the intervals between the stages in *timestamps* (stage -> time.perf_counter_ns())."""
+        with self._lock:
+            previous = None
+            for stage in STAGES:
+                ts = timestamps.get(stage)
+                if ts is None:
+                    continue
+                if previous is not None:
+                    self._histogram(name, stage).add(ts - previous)
+                previous = ts
+            start = timestamps.get(STAGES[0])
+            if start is not None and previous is not None and previous != start:
+                self._histogram(name, TOTAL).add(previous - start)
+
+    def _histogram(self, name, stage):
+        key = (name, stage)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = Histogram()
+        return histogram
+
+    def summary(self):
+        with self._lock:
+            keys = sorted(self.histograms, key=lambda key: (key[0], (STAGES + (TOTAL,)).index(key[1])))
+            return {f"{name}.{stage}": self.histograms[(name, stage)].summary() for name, stage in keys}
+
+    def format(self):
+        lines = []
+        for key, s in self.summary().items():
+            lines.append(f"{key:<24} n={s['count']:<6} mean={s['mean_us']:.0f}us p50<={s['p50_us']:.0f}us "
+                         f"p99<={s['p99_us']:.0f}us max={s['max_us']:.0f}us")
+        return "\n".join(lines)
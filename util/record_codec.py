@@ -0,0 +1,83 @@
+import gzip
+import json
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+COLUMNAR = "columnar"
+VERBOSE = "verbose"
+MOVE_FIELDS = ["score", "time", "rtime", "depth", "seldepth", "nodes", "nps", "hashfull"]
+
+
+def supported_encodings():
+    encodings = ["gzip"]
+    if zstandard is not None:
+        encodings.insert(0, "zstd")
+    return encodings
+
+
+def encode_game_record(record):
+    """
+    Convert a verbose game record into column arrays.
+    The per-move dicts are replaced by one array per field, and the move
+    strings are stored once in 'bestmoves'. Records that do not fit this
+    layout are returned unchanged.
+    """
+    moves = record.get("moves")
+    bestmoves = record.get("bestmoves")
+    if not moves or bestmoves is None or not all(isinstance(m, dict) for m in moves):
+        return record
+    played = [m for m in bestmoves if m != "(none)"]
+    if len(played) != len(moves):
+        return record
+    move_len = []
+    for move, bestmove in zip(moves, played):
+        if not bestmove.startswith(move["move"]):
+            return record
+        move_len.append(len(move["move"]))
+    encoded = {k: v for k, v in record.items() if k != "moves"}
+    encoded["columns"] = {field: [m.get(field) for m in moves] for field in MOVE_FIELDS}
+    if any(n != len(m) for n, m in zip(move_len, played)):
+        # jieqi appends the revealed pieces to bestmoves
+        encoded["move_len"] = move_len
+    return encoded
+
+
+def decode_game_record(encoded):
+    """Inverse of *encode_game_record*."""
+    if "columns" not in encoded:
+        return encoded
+    record = {k: v for k, v in encoded.items() if k not in ("columns", "move_len")}
+    played = [m for m in encoded["bestmoves"] if m != "(none)"]
+    move_len = encoded.get("move_len") or [len(m) for m in played]
+    columns = encoded["columns"]
+    record["moves"] = []
+    for i, bestmove in enumerate(played):
+        move = {"move": bestmove[:move_len[i]]}
+        for field in MOVE_FIELDS:
+            move[field] = columns[field][i]
+        record["moves"].append(move)
+    return record
+
+
+def encode_payload(payload, encodings=(), record_formats=()):
+    """
+    Serialize an upload payload into a request body and its headers.
+    Columnar records and body compression are only used when the server
+    has announced support for them, otherwise plain JSON is produced.
+    """
+    headers = {"Content-Type": "application/json"}
+    if COLUMNAR in record_formats and payload.get("game_records"):
+        payload = dict(payload)
+        payload["game_records"] = [encode_game_record(r) for r in payload["game_records"]]
+        headers["X-Record-Format"] = COLUMNAR
+    body = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    if "zstd" in encodings and zstandard is not None:
+        body = zstandard.ZstdCompressor().compress(body)
+        headers["Content-Encoding"] = "zstd"
+    elif "gzip" in encodings:
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
@@ -0,0 +1,145 @@
+"""
+A local stand-in for the fishtest server, for trying the client without the
+real server:
+
+    python -m util.stub_server --port 8000 --tasks tasks.json
+    python client.py --server http://127.0.0.1:8000 --output
+
+Tasks can be pushed to held poll requests with POST /add_task (a task item
+as returned by get_tasks) and invalidated with POST /invalidate
+({"task_ids": [...]}). Start with --no-poll to exercise the polling fallback.
+"""
+import argparse
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import util.record_codec as record_codec
+
+
+class StubState:
+    def __init__(self, tasks=None, webdrives=None, long_poll=True):
+        self.tasks = tasks or []
+        self.webdrives = webdrives or [""]
+        self.long_poll = long_poll
+        self.invalid_task_ids = []
+        self.program_version = None
+        self.results = []
+        self.condition = threading.Condition()
+
+    def notices(self):
+        data = {"upload_encodings": ["gzip"], "record_formats": [record_codec.COLUMNAR]}
+        if self.invalid_task_ids:
+            data["invalid_task_ids"] = list(self.invalid_task_ids)
+        if self.program_version:
+            data["program_version"] = self.program_version
+        return data
+
+    def poll(self, want_tasks, wait):
+        with self.condition:
+            self.condition.wait_for(lambda: (want_tasks and self.tasks) or self.invalid_task_ids
+                                    or self.program_version, timeout=wait)
+            data = self.notices()
+            self.invalid_task_ids = []
+            if want_tasks and self.tasks:
+                data["tasks"] = list(self.tasks)
+                data["webdrives"] = self.webdrives
+            return data
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    state: StubState = None
+
+    def read_json(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        encoding = self.headers.get("Content-Encoding")
+        if encoding == "gzip":
+            body = gzip.decompress(body)
+        elif encoding == "zstd":
+            if record_codec.zstandard is None:
+                raise ValueError("zstd body without zstandard installed")
+            body = record_codec.zstandard.ZstdDecompressor().decompress(body)
+        return json.loads(body or b"{}")
+
+    def reply(self, status, data):
+        body = data.encode() if isinstance(data, str) else json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.startswith("/get_tasks"):
+            data = self.state.notices()
+            data.update({"tasks": list(self.state.tasks), "webdrives": self.state.webdrives})
+            return self.reply(200, data)
+        self.reply(404, "not found")
+
+    def do_POST(self):
+        try:
+            data = self.read_json()
+        except ValueError as e:
+            return self.reply(415, repr(e))
+        state = self.state
+        if self.path == "/poll":
+            if not state.long_poll:
+                return self.reply(404, "not found")
+            return self.reply(200, state.poll(data.get("want_tasks", True), float(data.get("wait", 25))))
+        elif self.path == "/heartbeat":
+            with state.condition:
+                reply = state.notices()
+                state.invalid_task_ids = []
+            return self.reply(200, reply)
+        elif self.path == "/upload_result":
+            data["game_records"] = [record_codec.decode_game_record(r) for r in data.get("game_records") or []]
+            state.results.append(data)
+            print(f"Result {data.get('task_id')}: wdl={data.get('wdl')} ptnml={data.get('ptnml')} "
+                  f"games={len(data['game_records'])} format={self.headers.get('X-Record-Format', 'verbose')}")
+            return self.reply(200, "ok")
+        elif self.path == "/add_task":
+            with state.condition:
+                state.tasks.append(data)
+                state.condition.notify_all()
+            return self.reply(200, "ok")
+        elif self.path == "/invalidate":
+            with state.condition:
+                task_ids = data.get("task_ids", [])
+                state.tasks = [t for t in state.tasks if t.get("task_id") not in task_ids]
+                state.invalid_task_ids.extend(task_ids)
+                state.condition.notify_all()
+            return self.reply(200, "ok")
+        self.reply(404, "not found")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port=8000, tasks=None, webdrives=None, long_poll=True):
+    """Start the stand-in server in a background thread and return it."""
+    handler = type("Handler", (StubHandler,), {"state": StubState(tasks, webdrives, long_poll)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--tasks", type=str, default="")
+    parser.add_argument("--webdrive", type=str, action="append", default=[])
+    parser.add_argument("--no-poll", action="store_true", default=False)
+    args = parser.parse_args()
+    tasks = []
+    if args.tasks:
+        with open(args.tasks, "r") as f:
+            tasks = json.load(f)
+    server = serve(args.port, tasks, args.webdrive or None, not args.no_poll)
+    print(f"Stub server listening on 127.0.0.1:{args.port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,89 @@
+import heapq
+import itertools
+import threading
+import time
+
+
+class Deadline:
+    """
+    A watched deadline. Exactly one of *cancelled* and *expired* ends up set,
+    so a caller that cancels and then sees *expired* knows the callback runs.
+    """
+    def __init__(self, when, on_expire, lock):
+        self.when = when
+        self.on_expire = on_expire
+        self.cancelled = False
+        self.expired = False
+        self._lock = lock
+
+    def cancel(self):
+        with self._lock:
+            if not self.expired:
+                self.cancelled = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cancel()
+
+
+class Watchdog:
+    """
+    One thread watching the deadlines of all engines in the process.
+    Deadlines are kept in a heap ordered by expiry time. Cancelling only
+    marks the entry, it is dropped when it reaches the top of the heap.
+    """
+    def __init__(self):
+        self._heap = []
+        self._counter = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._thread_target, name="watchdog")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def watch(self, seconds, on_expire):
+        """
+        Call *on_expire* in the watchdog thread if the returned deadline is
+        not cancelled within *seconds*. A *seconds* of None is never expiring.
+        """
+        if seconds is None:
+            return Deadline(None, on_expire, threading.Lock())
+        deadline = Deadline(time.monotonic() + seconds, on_expire, self._condition)
+        with self._condition:
+            heapq.heappush(self._heap, (deadline.when, next(self._counter), deadline))
+            if self._heap[0][2] is deadline:
+                self._condition.notify()
+        return deadline
+
+    def _thread_target(self):
+        while True:
+            with self._condition:
+                while self._heap and self._heap[0][2].cancelled:
+                    heapq.heappop(self._heap)
+                if not self._heap:
+                    self._condition.wait()
+                    continue
+                timeout = self._heap[0][0] - time.monotonic()
+                if timeout > 0:
+                    self._condition.wait(timeout)
+                    continue
+                deadline = heapq.heappop(self._heap)[2]
+                deadline.expired = True
+
+            try:
+                deadline.on_expire()
+            except Exception as e:
+                print(f"Watchdog callback failed: {repr(e)}")
+
+
+_watchdog = None
+_watchdog_lock = threading.Lock()
+
+
+def get_watchdog():
+    global _watchdog
+    with _watchdog_lock:
+        if _watchdog is None:
+            _watchdog = Watchdog()
+        return _watchdog
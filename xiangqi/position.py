@@ -0,0 +1,310 @@
+import random
+
+# piece codes, 0 is an empty square, red (uppercase) pieces come first
+PIECES = " KABNRCPkabnrcp"
+PIECE_CODES = {c: i for i, c in enumerate(PIECES) if c != ' '}
+RED_PIECES = range(1, 8)
+BLACK_PIECES = range(8, 15)
+# piece types, the code of a black piece is its type + BLACK
+KING, ADVISOR, BISHOP, KNIGHT, ROOK, CANNON, PAWN = range(1, 8)
+BLACK = 7
+RANKS = 10
+FILES = 9
+SQUARES = RANKS * FILES
+
+_random = random.Random(0x5851F42D4C957F2D)
+# ZOBRIST[piece * SQUARES + square], the entries of the empty piece stay 0
+ZOBRIST = [0] * SQUARES + [_random.getrandbits(64) for _ in range(SQUARES * (len(PIECES) - 1))]
+ZOBRIST_SIDE = _random.getrandbits(64)
+del _random
+
+
+def parse_square(s):
+    """'a0' is the bottom left square of red, squares count from the top left (a9)."""
+    return (9 - int(s[1])) * FILES + ord(s[0]) - ord('a')
+
+
+def square_name(sq):
+    return chr(ord('a') + sq % FILES) + str(9 - sq // FILES)
+
+
+def parse_move(move_str):
+    return parse_square(move_str[0:2]), parse_square(move_str[2:4])
+
+
+def move_name(from_sq, to_sq):
+    return square_name(from_sq) + square_name(to_sq)
+
+
+ORTHOGONAL = ((-1, 0), (1, 0), (0, -1), (0, 1))
+DIAGONAL = ((-1, -1), (-1, 1), (1, -1), (1, 1))
+KNIGHT_STEPS = ((-2, -1), (-2, 1), (2, -1), (2, 1), (-1, -2), (1, -2), (-1, 2), (1, 2))
+
+
+def _on_board(row, col):
+    return 0 <= row < RANKS and 0 <= col < FILES
+
+
+def _in_palace(row, col, red):
+    return 3 <= col <= 5 and (7 <= row <= 9 if red else 0 <= row <= 2)
+
+
+def _own_half(row, red):
+    return row >= 5 if red else row <= 4
+
+
+class Position:
+    """
+    A xiangqi position as a 90-byte board with an incrementally updated
+    64-bit Zobrist key of the pieces and the side to move.
+    """
+    def __init__(self, fen):
+        parts = fen.split(' ')
+        if parts[0] == 'fen':
+            parts = parts[1:]
+        self.board = bytearray(SQUARES)
+        # number of pieces by code
+        self.counts = bytearray(len(PIECES))
+        self.key = 0
+        sq = 0
+        for c in parts[0]:
+            if c == '/':
+                continue
+            if c.isdigit():
+                sq += int(c)
+            else:
+                piece = PIECE_CODES[c]
+                self.board[sq] = piece
+                self.counts[piece] += 1
+                self.key ^= ZOBRIST[piece * SQUARES + sq]
+                sq += 1
+        self.side = 'b' if len(parts) > 1 and parts[1] == 'b' else 'w'
+        if self.side == 'b':
+            self.key ^= ZOBRIST_SIDE
+
+    def push(self, move_str):
+        """Play *move_str* like 'h2e2', return the captured piece code or 0."""
+        from_sq, to_sq = parse_move(move_str)
+        board = self.board
+        piece = board[from_sq]
+        captured = board[to_sq]
+        self.key ^= (ZOBRIST[piece * SQUARES + from_sq] ^ ZOBRIST[piece * SQUARES + to_sq]
+                     ^ ZOBRIST[captured * SQUARES + to_sq] ^ ZOBRIST_SIDE)
+        board[to_sq] = piece
+        board[from_sq] = 0
+        if captured:
+            self.counts[captured] -= 1
+        self.side = 'b' if self.side == 'w' else 'w'
+        return captured
+
+    def material(self, red):
+        """The pieces of a side other than the king, like 'AABBR'."""
+        offset = 0 if red else BLACK
+        return ''.join(PIECES[kind] * self.counts[kind + offset] for kind in range(ADVISOR, PAWN + 1))
+
+    def _pseudo_moves(self, red):
+        """(from, to) of all moves of a side, ignoring checks to its own king."""
+        board = self.board
+        own = RED_PIECES if red else BLACK_PIECES
+        moves = []
+        for from_sq in range(SQUARES):
+            if board[from_sq] in own:
+                self._piece_moves(from_sq, red, moves)
+        return moves
+
+    def _piece_moves(self, from_sq, red, moves):
+        """Append the (from, to) moves of the piece on *from_sq* to *moves*."""
+        board = self.board
+        own = RED_PIECES if red else BLACK_PIECES
+
+        def add(from_sq, row, col):
+            to_sq = row * FILES + col
+            if board[to_sq] not in own:
+                moves.append((from_sq, to_sq))
+
+        piece = board[from_sq]
+        kind = piece if red else piece - BLACK
+        row, col = divmod(from_sq, FILES)
+        if kind == KING or kind == ADVISOR:
+            for dr, dc in (ORTHOGONAL if kind == KING else DIAGONAL):
+                if _in_palace(row + dr, col + dc, red):
+                    add(from_sq, row + dr, col + dc)
+        elif kind == BISHOP:
+            for dr, dc in DIAGONAL:
+                r, c = row + 2 * dr, col + 2 * dc
+                if _on_board(r, c) and _own_half(r, red) and board[(row + dr) * FILES + col + dc] == 0:
+                    add(from_sq, r, c)
+        elif kind == KNIGHT:
+            for dr, dc in KNIGHT_STEPS:
+                r, c = row + dr, col + dc
+                leg = (row + dr // 2) * FILES + col if abs(dr) == 2 else row * FILES + col + dc // 2
+                if _on_board(r, c) and board[leg] == 0:
+                    add(from_sq, r, c)
+        elif kind == ROOK or kind == CANNON:
+            for dr, dc in ORTHOGONAL:
+                r, c = row + dr, col + dc
+                while _on_board(r, c) and board[r * FILES + c] == 0:
+                    moves.append((from_sq, r * FILES + c))
+                    r, c = r + dr, c + dc
+                if kind == CANNON:
+                    # jump over the screen to capture
+                    r, c = r + dr, c + dc
+                    while _on_board(r, c) and board[r * FILES + c] == 0:
+                        r, c = r + dr, c + dc
+                if _on_board(r, c) and board[r * FILES + c] not in own:
+                    moves.append((from_sq, r * FILES + c))
+        elif kind == PAWN:
+            forward = -1 if red else 1
+            if _on_board(row + forward, col):
+                add(from_sq, row + forward, col)
+            if not _own_half(row, red):
+                for c in (col - 1, col + 1):
+                    if 0 <= c < FILES:
+                        add(from_sq, row, c)
+
+    def _attacked(self, sq, red):
+        """Whether *sq* is attacked by the pieces of the other side than *red*."""
+        board = self.board
+        enemy = BLACK if red else 0
+        row, col = divmod(sq, FILES)
+        for dr, dc in ORTHOGONAL:
+            r, c = row + dr, col + dc
+            while _on_board(r, c) and board[r * FILES + c] == 0:
+                r, c = r + dr, c + dc
+            if not _on_board(r, c):
+                continue
+            piece = board[r * FILES + c]
+            # facing kings attack each other along the file
+            if piece == enemy + ROOK or (piece == enemy + KING and dc == 0):
+                return True
+            r, c = r + dr, c + dc
+            while _on_board(r, c) and board[r * FILES + c] == 0:
+                r, c = r + dr, c + dc
+            if _on_board(r, c) and board[r * FILES + c] == enemy + CANNON:
+                return True
+        for dr, dc in KNIGHT_STEPS:
+            r, c = row + dr, col + dc
+            if _on_board(r, c) and board[r * FILES + c] == enemy + KNIGHT:
+                # the leg is next to the knight, towards sq
+                leg = (r - dr // 2) * FILES + c if abs(dr) == 2 else r * FILES + c - dc // 2
+                if board[leg] == 0:
+                    return True
+        # an enemy pawn ahead, or beside once it crossed the river
+        r = row - 1 if red else row + 1
+        if _on_board(r, col) and board[r * FILES + col] == enemy + PAWN:
+            return True
+        if not _own_half(row, not red):
+            for c in (col - 1, col + 1):
+                if 0 <= c < FILES and board[row * FILES + c] == enemy + PAWN:
+                    return True
+        return False
+
+    def _king_in_check(self, red):
+        king = self.board.find(KING if red else BLACK + KING)
+        return king < 0 or self._attacked(king, red)
+
+    def in_check(self):
+        """Whether the side to move is in check."""
+        return self._king_in_check(self.side == 'w')
+
+    def _legal(self, from_sq, to_sq, red):
+        board = self.board
+        piece, captured = board[from_sq], board[to_sq]
+        board[to_sq], board[from_sq] = piece, 0
+        legal = not self._king_in_check(red)
+        board[from_sq], board[to_sq] = piece, captured
+        return legal
+
+    def legal_moves(self):
+        red = self.side == 'w'
+        return [move_name(from_sq, to_sq) for from_sq, to_sq in self._pseudo_moves(red)
+                if self._legal(from_sq, to_sq, red)]
+
+    def has_legal_moves(self):
+        red = self.side == 'w'
+        return any(self._legal(from_sq, to_sq, red) for from_sq, to_sq in self._pseudo_moves(red))
+
+    def is_legal(self, move_str):
+        try:
+            move = parse_move(move_str)
+        except (ValueError, IndexError):
+            return False
+        if move_name(*move) != move_str[:4]:
+            return False
+        red = self.side == 'w'
+        return move in self._pseudo_moves(red) and self._legal(move[0], move[1], red)
+
+    def is_checkmate(self):
+        return self.in_check() and not self.has_legal_moves()
+
+    def is_stalemate(self):
+        """No legal moves without being in check, a loss for the side to move in xiangqi."""
+        return not self.in_check() and not self.has_legal_moves()
+
+    def _attacks(self, sq, red):
+        """Squares of enemy pieces the piece on *sq* can capture, ignoring checks."""
+        moves = []
+        self._piece_moves(sq, red, moves)
+        return {to_sq for _, to_sq in moves if self.board[to_sq]}
+
+    def chases(self, move_str):
+        """
+        The squares of the enemy pieces chased by *move_str*, which is not
+        played: pieces the moved piece newly attacks that cannot be legally
+        taken back, and rooks attacked by a knight or cannon. Kings, pawns on their own half
+        and attacks by kings and pawns do not count.
+        """
+        from_sq, to_sq = parse_move(move_str)
+        board = self.board
+        red = self.side == 'w'
+        piece, captured = board[from_sq], board[to_sq]
+        kind = piece if red else piece - BLACK
+        if kind == KING or kind == PAWN:
+            return set()
+        before = self._attacks(from_sq, red)
+        board[to_sq], board[from_sq] = piece, 0
+        chased = set()
+        for sq in self._attacks(to_sq, red):
+            target_kind = board[sq] - BLACK if red else board[sq]
+            if sq in before or target_kind == KING or (target_kind == PAWN and _own_half(sq // FILES, not red)):
+                continue
+            if target_kind == ROOK and (kind == KNIGHT or kind == CANNON):
+                chased.add(sq)
+                continue
+            # protected if the other side can legally take back after the capture
+            victim = board[sq]
+            board[sq], board[to_sq] = piece, 0
+            protected = self._attacked(sq, red) and \
+                any(self._legal(from_sq2, sq, not red) for from_sq2, to_sq2 in self._pseudo_moves(not red)
+                    if to_sq2 == sq)
+            board[to_sq], board[sq] = piece, victim
+            if not protected:
+                chased.add(sq)
+        board[from_sq], board[to_sq] = piece, captured
+        return chased
+
+    def fen(self):
+        rows = []
+        for row in range(RANKS):
+            fen_row = ''
+            empty = 0
+            for piece in self.board[row * FILES:(row + 1) * FILES]:
+                if piece == 0:
+                    empty += 1
+                    continue
+                if empty > 0:
+                    fen_row += str(empty)
+                    empty = 0
+                fen_row += PIECES[piece]
+            if empty > 0:
+                fen_row += str(empty)
+            rows.append(fen_row)
+        return '/'.join(rows) + ' ' + self.side
+
+    def __str__(self):
+        board_str = ''
+        for row in range(RANKS):
+            for piece in self.board[row * FILES:(row + 1) * FILES]:
+                board_str += ' * ' if piece == 0 else f" {PIECES[piece]} "
+            board_str += '\n'
+        return board_str
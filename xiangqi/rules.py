@@ -0,0 +1,90 @@
+# Endings that cannot be won, as (stronger side, weaker side) material without
+# the kings, see Position.material(). Sides without rooks, knights, cannons
+# and pawns cannot mate and are not listed.
+DEAD_DRAWS = frozenset([
+    ('C', ''),
+    ('R', 'AABB'),
+    ('N', 'AABB'),
+    ('C', 'AABB'),
+    ('P', 'AABB'),
+])
+ATTACKERS = frozenset('RNCP')
+
+
+def can_mate(material):
+    return not ATTACKERS.isdisjoint(material)
+
+
+def is_dead_draw(position):
+    """Whether neither side can mate with the material left on *position*."""
+    red, black = position.material(True), position.material(False)
+    if not can_mate(red) and not can_mate(black):
+        return True
+    return (red, black) in DEAD_DRAWS or (black, red) in DEAD_DRAWS
+
+
+class Perpetual:
+    """
+    Perpetual check and perpetual chase detection over the positions since
+    the last capture, keyed by Position.key.
+
+    When a position repeats, the moves of the cycle since its previous
+    occurrence are judged: a side that checked with every one of its moves
+    loses, unless the other side did as well. Otherwise a side that checked
+    or chased with every move, chasing the same piece all through the cycle,
+    loses unless the other side did as well. Forbidden cycles are therefore
+    caught on their first repetition, before the repetition draw.
+    """
+    def __init__(self, key=None):
+        self.reset(key)
+
+    def reset(self, key=None):
+        """Start the history at the position *key*, called after a capture."""
+        self.history = []
+        self.last_seen = {} if key is None else {key: -1}
+
+    def add(self, key, side, move, check, chased):
+        """
+        Record that *side* ('w' or 'b') played *move* (from, to) to the
+        position *key*, giving check and chasing the pieces on the squares
+        *chased* (see Position.chases). Return the offending side of a
+        forbidden cycle as ('w' | 'b', 'check' | 'chase'), or None.
+        """
+        self.history.append((side, move, check, frozenset(chased)))
+        previous = self.last_seen.get(key)
+        self.last_seen[key] = len(self.history) - 1
+        if previous is None:
+            return None
+
+        cycle = self.history[previous + 1:]
+        checks = {}
+        for mover, _, check, _ in cycle:
+            checks[mover] = checks.get(mover, True) and check
+        if len(checks) < 2:
+            return None
+        if checks['w'] != checks['b']:
+            return ('w' if checks['w'] else 'b'), 'check'
+        elif checks['w']:
+            # both sides check, the repetition is a draw
+            return None
+        chases = {side: self._chases_one_piece(cycle, side) for side in ('w', 'b')}
+        if chases['w'] != chases['b']:
+            return ('w' if chases['w'] else 'b'), 'chase'
+        return None
+
+    @staticmethod
+    def _chases_one_piece(cycle, side):
+        """Whether every move of *side* in *cycle* checks or chases, with one piece chased throughout."""
+        # squares of the pieces chased by all chasing moves so far, following their moves
+        targets = None
+        for mover, (from_sq, to_sq), check, chased in cycle:
+            if mover != side:
+                if targets is not None and from_sq in targets:
+                    targets = (targets - {from_sq}) | {to_sq}
+            elif chased:
+                targets = set(chased) if targets is None else targets & chased
+                if not targets:
+                    return False
+            elif not check:
+                return False
+        return targets is not None